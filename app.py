@@ -1,760 +1,14 @@
-from flask import Flask, render_template, request, redirect, session, flash, Response, send_file
-import psycopg2
 import os
-from datetime import datetime, timedelta
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-from flask import send_file
-import pandas as pd
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-from sklearn.linear_model import LinearRegression
-import numpy as np
 
+from finance import create_app
+from finance.db import init_db
 
-
-app = Flask(__name__)
-app.secret_key = "supersecretkey"
-
-# ------------------ DATABASE ------------------
-
-from psycopg2.extras import RealDictCursor
-
-def get_db_connection():
-    database_url = os.environ.get("DATABASE_URL")
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
-
-def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id SERIAL PRIMARY KEY,
-        username TEXT UNIQUE,
-        password TEXT
-    )
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS income (
-        id SERIAL PRIMARY KEY,
-        title TEXT,
-        amount REAL,
-        category TEXT,
-        date TEXT,
-        user_id INTEGER
-    )
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS expenses (
-        id SERIAL PRIMARY KEY,
-        title TEXT,
-        amount REAL,
-        category TEXT,
-        date TEXT,
-        user_id INTEGER
-    )
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS budget (
-        id SERIAL PRIMARY KEY,
-        month TEXT,
-        amount REAL,
-        user_id INTEGER
-    )
-    """)
-
-    conn.commit()
-    conn.close()
-
-# ------------------ AUTH ------------------
-
-@app.route("/", methods=["GET", "POST"])
-def login_page():
-    if request.method == "POST":
-        username = request.form["username"]
-        password = request.form["password"]
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, username FROM users WHERE username = %s AND password = %s", (username, password))
-        user = cursor.fetchone()
-        conn.close()
-
-        if user:
-            session["user_id"] = user['id']
-            session["username"] = user["username"]
-            return redirect("/dashboard")
-        else:
-            flash("Invalid username or password")
-            return redirect("/")
-
-    return render_template("login.html")
-
-@app.route("/register", methods=["GET", "POST"])
-def register_page():
-    if request.method == "POST":
-        username = request.form["username"]
-        password = request.form["password"]
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)", (username, password))
-            conn.commit()
-        except:
-            conn.rollback()
-            flash("Username already exists")
-            return redirect("/register")
-        finally:
-            conn.close()
-
-        return redirect("/")
-
-    return render_template("register.html")
-
-@app.route("/logout")
-def logout():
-    session.clear()
-    return redirect("/")
-
-# ------------------ DASHBOARD ------------------
-
-@app.route("/dashboard")
-def dashboard():
-    if "user_id" not in session:
-        return redirect("/")
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Get incomes
-    cursor.execute("SELECT * FROM income WHERE user_id = %s", (session["user_id"],))
-    incomes = cursor.fetchall()
-
-    # Get expenses
-    cursor.execute("SELECT * FROM expenses WHERE user_id = %s", (session["user_id"],))
-    expenses = cursor.fetchall()
-
-    # Total income
-    cursor.execute("SELECT SUM(amount) AS total FROM income WHERE user_id = %s", (session["user_id"],))
-    total_income_row = cursor.fetchone()
-    total_income = total_income_row["total"] or 0
-
-    # Total expense
-    cursor.execute("SELECT SUM(amount) AS total FROM expenses WHERE user_id = %s", (session["user_id"],))
-    total_expense_row = cursor.fetchone()
-    total_expense = total_expense_row["total"] or 0
-
-    balance = total_income - total_expense
-
-    # Current month
-    current_month = datetime.now().strftime("%Y-%m")
-
-    # Get budget for this month
-    cursor.execute(
-        "SELECT amount FROM budget WHERE user_id = %s AND month = %s",
-        (session["user_id"], current_month)
-    )
-    row = cursor.fetchone()
-    monthly_budget = row["amount"] if row else 0
-
-    # This month expense
-    cursor.execute(
-        "SELECT SUM(amount) AS total FROM expenses WHERE user_id = %s AND date LIKE %s",
-        (session["user_id"], current_month + "%")
-    )
-    month_row = cursor.fetchone()
-    month_expense = month_row["total"] or 0
-
-    remaining_budget = monthly_budget - month_expense
-
-    if monthly_budget == 0:
-        budget_status = "not_set"
-    elif month_expense > monthly_budget:
-        budget_status = "over"
-    else:
-        budget_status = "under"
-
-    conn.close()
-
-    chart_path = generate_monthly_expense_chart(session["user_id"])
-    pie_chart_path = generate_category_pie_chart(session["user_id"])
-    predicted_expense, prediction_note = predict_next_month_expense(session["user_id"])
-    health_score, health_message = calculate_financial_health_score(session["user_id"])
-
-    
-    return render_template(
-        "dashboard.html",
-        username=session.get("username"),
-        incomes=incomes,
-        expenses=expenses,
-        total_income=total_income,
-        total_expense=total_expense,
-        balance=balance,
-        monthly_budget=monthly_budget,
-        month_expense=month_expense,
-        remaining_budget=remaining_budget,
-        budget_status=budget_status,
-        chart_path=chart_path,
-        pie_chart_path=pie_chart_path,
-        predicted_expense=predicted_expense,
-        prediction_note=prediction_note,
-        health_score=health_score,
-        health_message=health_message,
-    )
-
-# ------------------ ADD INCOME ------------------
-
-@app.route("/add_income", methods=["GET", "POST"])
-def add_income():
-    if "user_id" not in session:
-        return redirect("/")
-
-    if request.method == "POST":
-        title = request.form["title"]
-        amount = float(request.form["amount"])
-        category = request.form["category"]
-        date = request.form["date"]
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO income (user_id, title, amount, category, date) VALUES (%s, %s, %s, %s, %s)",
-            (session["user_id"], title, amount, category, date)
-        )
-        conn.commit()
-        conn.close()
-        return redirect("/dashboard")
-
-    return render_template("add_income.html")
-
-# ------------------ ADD EXPENSE ------------------
-
-@app.route("/add_expense", methods=["GET", "POST"])
-def add_expense():
-    if "user_id" not in session:
-        return redirect("/")
-
-    if request.method == "POST":
-        title = request.form["title"]
-        amount = float(request.form["amount"])
-        category = request.form["category"]
-        date = request.form["date"]
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO expenses (user_id, title, amount, category, date) VALUES (%s, %s, %s, %s, %s)",
-            (session["user_id"], title, amount, category, date)
-        )
-        conn.commit()
-        conn.close()
-        return redirect("/dashboard")
-
-    return render_template("add_expense.html")
-
-# ------------------ RUN ------------------
-@app.route("/set_budget", methods=["GET", "POST"])
-def set_budget():
-    if "user_id" not in session:
-        return redirect("/")
-
-    if request.method == "POST":
-        month = request.form["month"]
-        amount = float(request.form["amount"])
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Check if budget already exists
-        cursor.execute(
-            "SELECT id FROM budget WHERE user_id = %s AND month = %s",
-            (session["user_id"], month)
-        )
-        existing = cursor.fetchone()
-
-        if existing:
-            # Update
-            cursor.execute(
-                "UPDATE budget SET amount = %s WHERE user_id = %s AND month = %s",
-                (amount, session["user_id"], month)
-            )
-        else:
-            # Insert
-            cursor.execute(
-                "INSERT INTO budget (user_id, month, amount) VALUES (%s, %s, %s)",
-                (session["user_id"], month, amount)
-            )
-
-        conn.commit()
-        conn.close()
-        return redirect("/dashboard")
-
-    # You already have HTML file, so just render it
-    return render_template("set_budget.html")
-
-
-@app.route("/summary")
-def summary():
-
-    if "user_id" not in session:
-        return redirect("/")
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    now = datetime.now()
-    this_month = now.strftime("%Y-%m")
-
-    first_day = now.replace(day=1)
-    last_month_date = first_day - timedelta(days=1)
-    last_month = last_month_date.strftime("%Y-%m")
-
-    # This month expense
-    cursor.execute("""
-        SELECT SUM(amount) AS total
-        FROM expenses
-        WHERE user_id = %s AND date LIKE %s
-    """, (session["user_id"], this_month + "%"))
-
-    this_month_total = cursor.fetchone()
-    this_month_total_is = this_month_total["total"] or 0
-
-    # Last month expense
-    cursor.execute("""
-        SELECT SUM(amount) AS total
-        FROM expenses
-        WHERE user_id = %s AND date LIKE %s
-    """, (session["user_id"], last_month + "%"))
-
-    last_month_total = cursor.fetchone()
-    last_month_total_is = last_month_total["total"] or 0
-
-    conn.close()
-
-    diff = this_month_total_is - last_month_total_is
-
-    if last_month_total_is > 0:
-        percent_change = (diff / last_month_total_is) * 100
-    else:
-        percent_change = 0
-
-    if diff > 0:
-        message = "📈 Your spending increased compared to last month."
-    elif diff < 0:
-        message = "📉 Good! Your spending decreased."
-    else:
-        message = "➡️ Your spending is the same as last month."
-
-    return render_template(
-        "summary.html",
-        this_month_total=this_month_total_is,
-        last_month_total=last_month_total_is,
-        diff=diff,
-        percent_change=percent_change,
-        message=message,
-        this_month=this_month,
-        last_month=last_month
-    )
-
-@app.route("/export_expenses")
-def export_expenses():
-    if "user_id" not in session:
-        return redirect("/")
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT title, amount, category, date FROM expenses WHERE user_id = %s",
-        (session["user_id"],)
-    )
-    rows = cursor.fetchall()
-    conn.close()
-
-    def generate():
-        yield "Title,Amount,Category,Date\n"
-        for row in rows:
-            yield f"{row['title']},{row['amount']},{row['category']},{row['date']}\n"
-
-    return Response(
-        generate(),
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment; filename=expenses.csv"}
-    )
-
-
-@app.route("/export_expenses_pdf")
-def export_expenses_pdf():
-    if "user_id" not in session:
-        return redirect("/")
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT title, amount, category, date FROM expenses WHERE user_id = %s",
-        (session["user_id"],)
-    )
-    rows = cursor.fetchall()
-    conn.close()
-
-    file_path = "expenses_report.pdf"
-
-    doc = SimpleDocTemplate(file_path, pagesize=A4)
-    styles = getSampleStyleSheet()
-    elements = []
-
-    title = Paragraph("Expenses Report", styles["Title"])
-    elements.append(title)
-
-    data = [["Title", "Amount", "Category", "Date"]]
-
-    for row in rows:
-        data.append([
-            row["title"],
-            str(row["amount"]),
-            row["category"],
-            row["date"]
-        ])
-
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,0), colors.lightgrey),
-        ("GRID", (0,0), (-1,-1), 1, colors.black),
-        ("ALIGN", (1,1), (-1,-1), "CENTER"),
-    ]))
-
-    elements.append(table)
-    doc.build(elements)
-
-    return send_file(file_path, as_attachment=True)
-
-@app.route("/delete_expense/<int:expense_id>")
-def delete_expense(expense_id):
-    if "user_id" not in session:
-        return redirect("/")
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "DELETE FROM expenses WHERE id = %s AND user_id = %s",
-        (expense_id, session["user_id"])
-    )
-
-    conn.commit()
-    conn.close()
-
-    return redirect("/dashboard")
-
-@app.route("/delete_income/<int:income_id>")
-def delete_income(income_id):
-    if "user_id" not in session:
-        return redirect("/")
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "DELETE FROM income WHERE id = %s AND user_id = %s",
-        (income_id, session["user_id"])
-    )
-
-    conn.commit()
-    conn.close()
-
-    return redirect("/dashboard")
-
-@app.route("/edit_expense/<int:expense_id>", methods=["GET", "POST"])
-def edit_expense(expense_id):
-    if "user_id" not in session:
-        return redirect("/")
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Fetch expense
-    cursor.execute(
-        "SELECT * FROM expenses WHERE id = %s AND user_id = %s",
-        (expense_id, session["user_id"])
-    )
-    expense = cursor.fetchone()
-
-    if not expense:
-        conn.close()
-        return redirect("/dashboard")
-
-    if request.method == "POST":
-        title = request.form["title"]
-        amount = request.form["amount"]
-        category = request.form["category"]
-        date = request.form["date"]
-
-        cursor.execute(
-            "UPDATE expenses SET title = %s, amount = %s, category = %s, date = %s WHERE id = %s AND user_id = %s",
-            (title, amount, category, date, expense_id, session["user_id"])
-        )
-
-        conn.commit()
-        conn.close()
-        return redirect("/dashboard")
-
-    conn.close()
-    return render_template("edit_expense.html", expense=expense)
-
-
-@app.route("/edit_income/<int:income_id>", methods=["GET", "POST"])
-def edit_income(income_id):
-    if "user_id" not in session:
-        return redirect("/")
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT * FROM income WHERE id = %s AND user_id = %s",
-        (income_id, session["user_id"])
-    )
-    income = cursor.fetchone()
-
-    if not income:
-        conn.close()
-        return redirect("/dashboard")
-
-    if request.method == "POST":
-        title = request.form["title"]
-        amount = request.form["amount"]
-        category = request.form["category"]
-        date = request.form["date"]
-
-        cursor.execute(
-            "UPDATE income SET title = %s, amount = %s, category = %s, date = %s WHERE id = %s AND user_id = %s",
-            (title, amount, category, date, income_id, session["user_id"])
-        )
-
-        conn.commit()
-        conn.close()
-        return redirect("/dashboard")
-
-    conn.close()
-    return render_template("edit_income.html", income=income)
-
-
-def get_expense_dataframe(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT date, amount, category FROM expenses WHERE user_id = %s",
-        (user_id,)
-    )
-    rows = cursor.fetchall()
-    conn.close()
-
-    df = pd.DataFrame(rows, columns=["date", "amount", "category"])
-    return df
-
-def generate_monthly_expense_chart(user_id):
-    df = get_expense_dataframe(user_id)
-
-    if df.empty:
-        return None
-
-    df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
-    df["date"] = pd.to_datetime(df["date"])
-
-    df["month"] = df["date"].dt.to_period("M")
-    monthly = df.groupby("month")["amount"].sum()
-
-    plt.figure(figsize=(6, 4))
-    monthly.plot(kind="bar")
-    plt.title("Monthly Expenses")
-    plt.xlabel("Month")
-    plt.ylabel("Amount")
-
-    path = "static/charts/monthly_expense.png"
-    plt.tight_layout()
-    plt.savefig(path)
-    plt.close()
-
-    return path
-
-def generate_category_pie_chart(user_id):
-    df = get_expense_dataframe(user_id)
-
-    if df.empty:
-        return None
-
-    df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
-
-    category_sum = df.groupby("category")["amount"].sum()
-
-    plt.figure(figsize=(6, 4))
-    category_sum.plot(kind="pie", autopct="%1.1f%%")
-    plt.title("Expense by Category")
-    plt.ylabel("")
-
-    path = "static/charts/category_expense.png"
-    plt.tight_layout()
-    plt.savefig(path)
-    plt.close()
-
-    return path
-
-def get_monthly_expense_for_ml(user_id):
-    df = get_expense_dataframe(user_id)
-
-    if df.empty:
-        return None, None
-
-    df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
-    df["date"] = pd.to_datetime(df["date"])
-
-    df["year_month"] = df["date"].dt.to_period("M")
-    monthly = df.groupby("year_month")["amount"].sum().reset_index()
-
-    monthly["time_index"] = range(1, len(monthly) + 1)
-
-    X = monthly[["time_index"]]
-    y = monthly["amount"]
-
-    return X, y
-
-def predict_next_month_expense(user_id):
-    X, y = get_monthly_expense_for_ml(user_id)
-
-    if X is None or len(y) == 0:
-        return None, "Not enough data to predict."
-
-    history = list(y)
-
-    if len(history) == 1:
-        return float(history[0]), "Only one month data. Prediction equals last month."
-
-    model = LinearRegression()
-    model.fit(X, y)
-
-    next_index = X["time_index"].max() + 1
-    predicted = model.predict([[next_index]])[0]
-
-    min_expense = min(history)
-    max_expense = max(history)
-    avg_expense = sum(history) / len(history)
-
-    smart_min = min(min_expense * 0.7, avg_expense * 0.5)
-    smart_max = max_expense * 1.5
-
-    if predicted < smart_min:
-        predicted = smart_min
-    if predicted > smart_max:
-        predicted = smart_max
-
-    return float(predicted), f"Prediction based on {len(history)} months of data."
-
-def calculate_financial_health_score(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Total income
-    cursor.execute("SELECT SUM(amount) AS total FROM income WHERE user_id = %s", (user_id,))
-    income_row = cursor.fetchone()
-    total_income = income_row["total"] or 0
-
-    # Total expense
-    cursor.execute("SELECT SUM(amount) AS total FROM expenses WHERE user_id = %s", (user_id,))
-    expense_row = cursor.fetchone()
-    total_expense = expense_row["total"] or 0
-
-    # Current month budget
-    from datetime import datetime
-    current_month = datetime.now().strftime("%Y-%m")
-
-    cursor.execute(
-        "SELECT amount FROM budget WHERE user_id = %s AND month = %s",
-        (user_id, current_month)
-    )
-    row = cursor.fetchone()
-    monthly_budget = row["amount"] if row else 0
-
-    conn.close()
-
-    # If no income, cannot calculate
-    if total_income == 0:
-        return 0, "No income data yet."
-
-    savings = total_income - total_expense
-    savings_ratio = savings / total_income
-
-    # Base score
-    score = savings_ratio * 100
-
-    # Budget penalty
-    if monthly_budget > 0 and total_expense > monthly_budget:
-        over = (total_expense - monthly_budget) / monthly_budget
-        score -= over * 30
-
-    # Clamp score
-    if score < 0:
-        score = 0
-    if score > 100:
-        score = 100
-
-    # Message
-    if score >= 80:
-        msg = "Excellent! Your financial health is very good."
-    elif score >= 60:
-        msg = "Good. You are managing your finances well."
-    elif score >= 40:
-        msg = "Average. Try to save more."
-    else:
-        msg = "Poor. You should control your expenses."
-
-    return int(score), msg
-
-@app.route("/profile")
-def profile():
-    if "user_id" not in session:
-        return redirect("/")
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Get user info
-    cursor.execute("SELECT username FROM users WHERE id = %s", (session["user_id"],))
-    user = cursor.fetchone()
-
-    # Total income
-    cursor.execute("SELECT SUM(amount) AS total FROM income WHERE user_id = %s", (session["user_id"],))
-    income_row = cursor.fetchone()
-    total_income = income_row["total"] or 0
-
-    # Total expense
-    cursor.execute("SELECT SUM(amount) AS total FROM expenses WHERE user_id = %s", (session["user_id"],))
-    expense_row = cursor.fetchone()
-    total_expense = expense_row["total"] or 0
-
-    balance = total_income - total_expense
-
-    conn.close()
-
-    return render_template(
-        "profile.html",
-        username=user["username"],
-        total_income=total_income,
-        total_expense=total_expense,
-        balance=balance
-    )
+# Routes live in finance/blueprints, queries in finance/repository.py and the
+# analytics built on them in finance/services.py.
+app = create_app()
 
 if __name__ == "__main__":
-    init_db()
+    with app.app_context():
+        init_db()
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port)
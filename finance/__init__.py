@@ -0,0 +1,29 @@
+import os
+
+from flask import Flask
+
+# Templates and static files stay at the project root, next to app.py
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def create_app():
+    app = Flask(
+        __name__,
+        template_folder=os.path.join(PROJECT_ROOT, "templates"),
+        static_folder=os.path.join(PROJECT_ROOT, "static"),
+        instance_path=os.path.join(PROJECT_ROOT, "instance"),
+    )
+    app.secret_key = "supersecretkey"
+
+    from finance import cli, db, instrumentation, services
+    from finance.blueprints import BLUEPRINTS
+
+    services.check_chart_assets(app)
+
+    db.init_app(app)
+    instrumentation.init_app(app)
+    cli.init_app(app)
+    for blueprint in BLUEPRINTS:
+        app.register_blueprint(blueprint)
+
+    return app
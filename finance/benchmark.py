@@ -0,0 +1,237 @@
+import os
+import json
+import math
+import queue
+import random
+import resource
+import secrets
+import threading
+import time
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from finance import PROJECT_ROOT, db, repository, services
+from finance.instrumentation import registry
+
+# Load harness for the hot routes. Synthetic users are seeded through the
+# normal import path, then each route is driven concurrently through the WSGI
+# test client, so numbers exclude the network and HTTP server but include
+# everything the app does. Run with: flask benchmark
+#
+# Seeding creates real accounts, so the harness only runs against a dedicated
+# BENCHMARK_DATABASE_URL, or against DATABASE_URL when told --i-know.
+
+BENCHMARK_SIZES = (1000, 10000, 100000)
+BENCHMARK_ROUTES = ("/dashboard", "/summary", "/profile", "/export_expenses", "/export_expenses_pdf")
+BENCHMARK_MONTHS = int(os.environ.get("BENCHMARK_MONTHS", 24))
+BENCHMARK_BASELINE = os.environ.get("BENCHMARK_BASELINE", os.path.join(PROJECT_ROOT, "benchmarks", "baseline.json"))
+BENCHMARK_DATABASE_URL = os.environ.get("BENCHMARK_DATABASE_URL")
+RSS_SAMPLE_INTERVAL = 0.01
+
+EXPENSE_CATEGORIES = ["Rent", "Food", "Transport", "Utilities", "Shopping", "Health", "Entertainment", "Travel"]
+INCOME_CATEGORIES = ["Salary", "Freelance", "Interest"]
+
+# ------------------ SEEDING ------------------
+
+def bench_username(size):
+    return f"bench-{size}"
+
+def synthetic_transactions(size, months, today=None):
+    """Yield (line, row) pairs in the importer's format, seeded by size so reruns match."""
+    rng = random.Random(size)
+    today = today or date.today()
+
+    for line in range(1, size + 1):
+        day = today - timedelta(days=rng.randrange(months * 30))
+        # Roughly one income for every four expenses
+        if rng.random() < 0.2:
+            yield line, ("income", "Payment", round(rng.uniform(500, 5000), 2), rng.choice(INCOME_CATEGORIES), day)
+        else:
+            category = rng.choice(EXPENSE_CATEGORIES)
+            yield line, ("expense", f"{category} {line}", round(rng.uniform(1, 300), 2), category, day)
+
+def use_benchmark_database(i_know=False):
+    """Switch the app to BENCHMARK_DATABASE_URL and migrate it; refuse the app's own database unless i_know."""
+    if BENCHMARK_DATABASE_URL:
+        db.use_database(BENCHMARK_DATABASE_URL)
+        db.run_migrations()
+    elif not i_know:
+        raise ValueError(
+            "Set BENCHMARK_DATABASE_URL to a dedicated database, or pass --i-know to seed "
+            "benchmark users into DATABASE_URL."
+        )
+
+def seed_user(size, months=BENCHMARK_MONTHS):
+    """Create bench-<size> with size transactions, reusing it when already seeded.
+
+    Returns (user_id, username, password). The password is random and only
+    lives in this process; a leftover account gets a fresh one each run.
+    """
+    username = bench_username(size)
+    password = secrets.token_urlsafe(24)
+    if not repository.create_user(username, password):
+        repository.set_password(username, password)
+    user = repository.find_user(username, password)
+
+    existing = repository.count_transactions(user["id"])
+    if existing == 0:
+        services.import_transactions(user["id"], synthetic_transactions(size, months))
+    elif existing != size:
+        raise ValueError(f"{username} already has {existing} transactions, expected {size}")
+
+    return user["id"], username, password
+
+# ------------------ MEASUREMENT ------------------
+
+def current_rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        # No procfs: fall back to the process high-water mark
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class RssSampler(threading.Thread):
+    """Track the largest resident set size seen while a route is being driven."""
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.interval = interval
+        self.start_kb = self.peak_kb = current_rss_kb()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.peak_kb = max(self.peak_kb, current_rss_kb())
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.peak_kb = max(self.peak_kb, current_rss_kb())
+        return self.start_kb, self.peak_kb
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def login_clients(app, username, password, count):
+    clients = queue.Queue()
+    for _ in range(count):
+        client = app.test_client()
+        response = client.post("/", data={"username": username, "password": password})
+        if response.headers.get("Location") != "/dashboard":
+            raise RuntimeError(f"could not log in as {username}")
+        clients.put(client)
+    return clients
+
+def drive_route(app, username, password, path, requests, concurrency, warmup=1):
+    """Issue requests GETs to path from concurrency logged-in clients and summarise them."""
+    clients = login_clients(app, username, password, concurrency)
+
+    def fetch():
+        client = clients.get()
+        try:
+            started = time.perf_counter()
+            response = client.get(path)
+            # Streamed exports are only finished once the body is read
+            response.get_data()
+            return time.perf_counter() - started, response.status_code
+        finally:
+            clients.put(client)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Lazy imports and chart renders happen here rather than in the timings
+        for _ in range(warmup):
+            pool.submit(fetch).result()
+
+        queries_before = registry.total("finance_db_queries_total")
+        sampler = RssSampler()
+        sampler.start()
+        started = time.perf_counter()
+        results = list(pool.map(lambda _: fetch(), range(requests)))
+        elapsed = time.perf_counter() - started
+        start_kb, peak_kb = sampler.stop()
+        queries = registry.total("finance_db_queries_total") - queries_before
+
+    latencies = sorted(seconds for seconds, _ in results)
+    return {
+        "requests": requests,
+        "errors": sum(1 for _, status in results if status != 200),
+        "throughput": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "queries_per_request": round(queries / requests, 2),
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "rss_growth_mb": round((peak_kb - start_kb) / 1024, 1),
+    }
+
+def run_benchmark(app, sizes, routes, requests, concurrency, report=print):
+    """Seed one user per size and drive every route for each; returns {"<size> <route>": result}."""
+    results = {}
+    for size in sizes:
+        started = time.perf_counter()
+        _, username, password = seed_user(size)
+        report(f"Seeded {username} in {time.perf_counter() - started:.1f}s")
+
+        for path in routes:
+            result = drive_route(app, username, password, path, requests, concurrency)
+            results[f"{size} {path}"] = result
+            report(format_result(f"{size} {path}", result))
+
+    return results
+
+def format_result(key, result):
+    return (
+        f"{key:<28} {result['throughput']:8.1f} req/s  "
+        f"p50 {result['p50_ms']:8.1f}  p95 {result['p95_ms']:8.1f}  p99 {result['p99_ms']:8.1f} ms  "
+        f"{result['queries_per_request']:5.1f} queries  "
+        f"RSS {result['peak_rss_mb']:.0f} MB (+{result['rss_growth_mb']:.0f})"
+        + (f"  {result['errors']} errors" if result["errors"] else "")
+    )
+
+# ------------------ BASELINES ------------------
+
+def save_baseline(path, results, concurrency):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "concurrency": concurrency,
+            "results": results,
+        }, f, indent=2, sort_keys=True)
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def find_regressions(baseline, results, tolerance):
+    """Compare against a stored run; latency and throughput get tolerance, query counts none."""
+    regressions = []
+    for key, result in results.items():
+        before = baseline["results"].get(key)
+        if before is None:
+            continue
+
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{key}: {result['errors']} errors (was {before['errors']})")
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{key}: p95 {result['p95_ms']} ms (was {before['p95_ms']} ms)")
+        if result["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{key}: {result['throughput']} req/s (was {before['throughput']} req/s)")
+        # Query counts do not depend on the machine, so any increase is real
+        if result["queries_per_request"] > before["queries_per_request"] + 0.5:
+            regressions.append(
+                f"{key}: {result['queries_per_request']} queries per request (was {before['queries_per_request']})"
+            )
+
+    return regressions
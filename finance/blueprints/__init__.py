@@ -0,0 +1,8 @@
+from finance.blueprints.auth import bp as auth
+from finance.blueprints.transactions import bp as transactions
+from finance.blueprints.budget import bp as budget
+from finance.blueprints.recurring import bp as recurring
+from finance.blueprints.reports import bp as reports
+from finance.blueprints.analytics import bp as analytics
+
+BLUEPRINTS = [auth, transactions, budget, recurring, reports, analytics]
@@ -0,0 +1,198 @@
+from datetime import datetime
+from functools import wraps
+
+from flask import Blueprint, render_template, request, redirect, session, Response, jsonify, make_response
+from werkzeug.http import is_resource_modified
+
+from finance import repository, services
+from finance.cache import chart_cache, metrics_cache, page_cache
+
+bp = Blueprint("analytics", __name__)
+
+# ------------------ CONDITIONAL PAGES ------------------
+
+def versioned_page(view):
+    """Answer repeat visits from the data version alone.
+
+    A browser that already has the current page gets a 304; with PAGE_CACHE_SIZE
+    set, anyone else gets the HTML rendered for this version. Either way the
+    cost is one data_version lookup instead of the view's queries.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not services.PAGE_CACHING or "user_id" not in session:
+            return view(*args, **kwargs)
+
+        user_id = session["user_id"]
+        etag, last_modified = services.page_validators(
+            request.endpoint, user_id, repository.get_data_stamp(user_id)
+        )
+
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            response = Response(status=304)
+        else:
+            key = (user_id, request.endpoint)
+            cached = page_cache.get(key) if page_cache else None
+            if cached and cached[0] == etag:
+                response = Response(cached[1], mimetype="text/html")
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if page_cache:
+                    page_cache.set(key, (etag, response.get_data()))
+
+        response.set_etag(etag, weak=True)
+        response.last_modified = last_modified
+        response.headers["Cache-Control"] = services.PAGE_CACHE_CONTROL
+        response.vary.add("Cookie")
+        return response
+
+    return wrapper
+
+# ------------------ DASHBOARD ------------------
+
+@bp.route("/dashboard")
+@versioned_page
+def dashboard():
+    if "user_id" not in session:
+        return redirect("/")
+
+    user_id = session["user_id"]
+    snapshot = services.load_dashboard_snapshot(user_id)
+
+    # Everything below depends only on the snapshot, so the charts and a
+    # stale forecast's refit run on the fan-out pool while this thread
+    # scores the health and warms the cache; the page costs the slowest piece.
+    version = snapshot["data_version"]
+    forecast = services.submit_dashboard_forecast(user_id, snapshot)
+
+    # In client mode the browser draws the charts from /api/charts/*
+    monthly_chart = pie_chart = None
+    if services.CHART_MODE == "server":
+        monthly_chart = services.submit(
+            services.generate_monthly_expense_chart, user_id, monthly=snapshot["monthly"], version=version
+        )
+        pie_chart = services.submit(
+            services.generate_category_pie_chart, user_id, by_category=snapshot["by_category"], version=version
+        )
+
+    health_score, health_message = services.calculate_financial_health_score(user_id, totals=snapshot)
+
+    # Warm the metrics cache so profile() and friends skip their totals queries
+    metrics_cache.set(
+        user_id,
+        services.build_user_metrics(snapshot, version, datetime.now().strftime("%Y-%m"))
+    )
+
+    predicted_expense, prediction_note = services.finish_dashboard_forecast(user_id, snapshot, forecast)
+    chart_path = monthly_chart.result() if monthly_chart else None
+    pie_chart_path = pie_chart.result() if pie_chart else None
+
+    return render_template(
+        "dashboard.html",
+        username=session.get("username"),
+        incomes=snapshot["incomes"],
+        incomes_next=snapshot["incomes_next"],
+        expenses=snapshot["expenses"],
+        expenses_next=snapshot["expenses_next"],
+        total_income=snapshot["total_income"],
+        total_expense=snapshot["total_expense"],
+        balance=snapshot["balance"],
+        monthly_budget=snapshot["monthly_budget"],
+        month_expense=snapshot["month_expense"],
+        remaining_budget=snapshot["remaining_budget"],
+        budget_status=snapshot["budget_status"],
+        budgets=snapshot["budgets"],
+        chart_mode=services.CHART_MODE,
+        chartjs_asset=services.CHARTJS_ASSET,
+        has_expense_data=bool(snapshot["expenses"]),
+        chart_path=chart_path,
+        pie_chart_path=pie_chart_path,
+        predicted_expense=predicted_expense,
+        prediction_note=prediction_note,
+        health_score=health_score,
+        health_message=health_message,
+    )
+
+# ------------------ SUMMARY ------------------
+
+@bp.route("/summary")
+@versioned_page
+def summary():
+
+    if "user_id" not in session:
+        return redirect("/")
+
+    return render_template("summary.html", **services.get_month_comparison(session["user_id"]))
+
+# ------------------ PROFILE ------------------
+
+@bp.route("/profile")
+@versioned_page
+def profile():
+    if "user_id" not in session:
+        return redirect("/")
+
+    username = repository.get_username(session["user_id"])
+    metrics = services.get_user_metrics(session["user_id"])
+
+    return render_template(
+        "profile.html",
+        username=username,
+        total_income=metrics["total_income"],
+        total_expense=metrics["total_expense"],
+        balance=metrics["balance"]
+    )
+
+# ------------------ CHARTS ------------------
+
+@bp.route("/charts/<int:user_id>/<any(monthly, category):kind>-v<int:version>-<digest>.png")
+def chart_image(user_id, kind, version, digest):
+    if "user_id" not in session:
+        return redirect("/")
+
+    if user_id != session["user_id"]:
+        return "Forbidden", 403
+
+    entry = chart_cache.get((user_id, kind, version))
+
+    # Another worker rendered it and the file is not shared: rebuild if still current
+    if entry is None and version == repository.get_data_version(user_id):
+        entry = services.get_chart(user_id, kind, version)
+
+    if entry is None:
+        return "Chart not found", 404
+
+    response = Response(entry[1], mimetype="image/png")
+    response.headers["Cache-Control"] = services.CHART_CACHE_CONTROL
+    response.set_etag(entry[0])
+    return response.make_conditional(request)
+
+@bp.route("/api/charts/monthly")
+def monthly_chart_data():
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    return jsonify({"months": repository.get_monthly_expense_totals(session["user_id"])})
+
+@bp.route("/api/charts/category")
+def category_chart_data():
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    return jsonify({"categories": repository.get_category_expense_totals(session["user_id"])})
+
+# ------------------ TRENDS ------------------
+
+@bp.route("/api/trends")
+def trends():
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    try:
+        params = services.parse_trend_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(services.get_trends(session["user_id"], **params))
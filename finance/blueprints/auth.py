@@ -0,0 +1,44 @@
+from flask import Blueprint, render_template, request, redirect, session, flash
+
+from finance import repository
+
+bp = Blueprint("auth", __name__)
+
+# ------------------ AUTH ------------------
+
+@bp.route("/", methods=["GET", "POST"])
+def login_page():
+    if request.method == "POST":
+        username = request.form["username"]
+        password = request.form["password"]
+
+        user = repository.find_user(username, password)
+
+        if user:
+            session["user_id"] = user['id']
+            session["username"] = user["username"]
+            return redirect("/dashboard")
+        else:
+            flash("Invalid username or password")
+            return redirect("/")
+
+    return render_template("login.html")
+
+@bp.route("/register", methods=["GET", "POST"])
+def register_page():
+    if request.method == "POST":
+        username = request.form["username"]
+        password = request.form["password"]
+
+        if not repository.create_user(username, password):
+            flash("Username already exists")
+            return redirect("/register")
+
+        return redirect("/")
+
+    return render_template("register.html")
+
+@bp.route("/logout")
+def logout():
+    session.clear()
+    return redirect("/")
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from flask import Blueprint, render_template, request, redirect, session, jsonify
+
+from finance import repository, services
+
+bp = Blueprint("budget", __name__)
+
+# ------------------ BUDGET ------------------
+
+@bp.route("/set_budget", methods=["GET", "POST"])
+def set_budget():
+    if "user_id" not in session:
+        return redirect("/")
+
+    if request.method == "POST":
+        category = request.form.get("category", "").replace("\x00", "").strip()
+        try:
+            amount = float(request.form["amount"])
+        except (KeyError, ValueError):
+            return "Invalid amount", 400
+        if not 0 <= amount < 10 ** 10:
+            return "Invalid amount", 400
+
+        # A recurring budget applies to every month that has none of its own
+        if request.form.get("recurring"):
+            repository.save_recurring_budget(session["user_id"], amount, category)
+            return redirect("/dashboard")
+
+        # Stored as YYYY-MM so "2026-1" matches the to_char month keys it is compared with
+        try:
+            month = datetime.strptime(request.form.get("month", "").strip(), "%Y-%m").strftime("%Y-%m")
+        except ValueError:
+            return "Invalid month, expected YYYY-MM", 400
+
+        repository.save_budget(session["user_id"], month, amount, category)
+        return redirect("/dashboard")
+
+    # You already have HTML file, so just render it
+    return render_template("set_budget.html")
+
+@bp.route("/api/budgets")
+def budget_status():
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    month = request.args.get("month") or datetime.now().strftime("%Y-%m")
+    try:
+        month = datetime.strptime(month, "%Y-%m").strftime("%Y-%m")
+    except ValueError:
+        return jsonify({"error": "month must be YYYY-MM"}), 400
+
+    return jsonify({"month": month, "budgets": services.get_budget_status(session["user_id"], month)})
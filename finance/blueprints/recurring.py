@@ -0,0 +1,87 @@
+import os
+from datetime import datetime, timedelta
+
+from flask import Blueprint, render_template, request, redirect, session
+
+from finance import repository, services
+
+bp = Blueprint("recurring", __name__)
+
+# ------------------ RECURRING ------------------
+
+RECURRING_MAX_INTERVAL = int(os.environ.get("RECURRING_MAX_INTERVAL", 366))
+RECURRING_MAX_BACKDATE_DAYS = int(os.environ.get("RECURRING_MAX_BACKDATE_DAYS", 366))
+
+def parse_recurring_form(form):
+    """Validate the rule form; raises ValueError with a message for the page."""
+    kind = form.get("kind", "expense")
+    if kind not in repository.ROLLUP_TABLES:
+        raise ValueError("Choose income or expense.")
+
+    frequency = form.get("frequency", "monthly")
+    if frequency not in repository.RECURRING_FREQUENCIES:
+        raise ValueError("Choose monthly, weekly or custom.")
+
+    try:
+        amount = float(form["amount"])
+        repeat_every = int(form.get("repeat_every") or 1)
+        start_date = datetime.strptime(form["start_date"], "%Y-%m-%d").date()
+        end_date = datetime.strptime(form["end_date"], "%Y-%m-%d").date() if form.get("end_date") else None
+    except (KeyError, ValueError):
+        raise ValueError("Enter an amount, a whole number for the interval and dates as YYYY-MM-DD.")
+
+    # Bounds keep values inside the NUMERIC(12, 2) and DATE columns and the
+    # request's own catch-up (see recurring_page) to about one batch
+    if not 0 < amount < 10 ** 10:
+        raise ValueError("The amount must be more than 0 and less than 10,000,000,000.")
+    if not 1 <= repeat_every <= RECURRING_MAX_INTERVAL:
+        raise ValueError(f"The interval must be between 1 and {RECURRING_MAX_INTERVAL}.")
+
+    today = datetime.now().date()
+    if not today - timedelta(days=RECURRING_MAX_BACKDATE_DAYS) <= start_date <= today + timedelta(days=3660):
+        raise ValueError(
+            f"The start date must be within the last {RECURRING_MAX_BACKDATE_DAYS} days or the next ten years."
+        )
+    if end_date and end_date < start_date:
+        raise ValueError("The end date is before the start date.")
+
+    return {
+        "kind": kind,
+        "title": form.get("title", "").replace("\x00", "").strip(),
+        "amount": amount,
+        "category": form.get("category", "").replace("\x00", "").strip() or None,
+        "frequency": frequency,
+        "repeat_every": repeat_every,
+        "start_date": start_date,
+        "end_date": end_date,
+    }
+
+@bp.route("/recurring", methods=["GET", "POST"])
+def recurring_page():
+    if "user_id" not in session:
+        return redirect("/")
+
+    user_id = session["user_id"]
+    error = None
+
+    if request.method == "POST":
+        try:
+            rule = parse_recurring_form(request.form)
+        except ValueError as e:
+            error = str(e)
+        else:
+            repository.create_recurring_rule(user_id, **rule)
+            # Occurrences up to today appear straight away; one pass caps the work
+            # at RECURRING_MAX_CATCHUP per rule, and the scheduler does any rest
+            services.materialize_recurring(user_id=user_id, max_passes=1)
+            return redirect("/recurring")
+
+    return render_template("recurring.html", rules=repository.get_recurring_rules(user_id), error=error)
+
+@bp.route("/recurring/<int:rule_id>/stop", methods=["POST"])
+def stop_recurring(rule_id):
+    if "user_id" not in session:
+        return redirect("/")
+
+    repository.stop_recurring_rule(session["user_id"], rule_id)
+    return redirect("/recurring")
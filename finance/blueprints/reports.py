@@ -0,0 +1,102 @@
+from io import BytesIO
+
+from flask import Blueprint, request, redirect, session, Response, send_file, jsonify, stream_with_context
+
+from finance import services
+from finance.jobs import enqueue_job, get_job, job_status
+
+bp = Blueprint("reports", __name__)
+
+# ------------------ EXPORT ------------------
+
+def csv_export_response(kind, filename):
+    if "user_id" not in session:
+        return redirect("/")
+
+    try:
+        filters = services.parse_export_filters(request.args)
+    except ValueError:
+        return "Invalid date filter, expected YYYY-MM-DD", 400
+
+    return Response(
+        stream_with_context(services.stream_transactions_csv(session["user_id"], kind, filters)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@bp.route("/export_expenses")
+def export_expenses():
+    return csv_export_response("expense", "expenses.csv")
+
+@bp.route("/export_income")
+def export_income():
+    return csv_export_response("income", "income.csv")
+
+@bp.route("/export_expenses_pdf")
+def export_expenses_pdf():
+    if "user_id" not in session:
+        return redirect("/")
+
+    try:
+        filters = services.parse_export_filters(request.args)
+    except ValueError:
+        return "Invalid date filter, expected YYYY-MM-DD", 400
+
+    report = services.build_expenses_pdf(session["user_id"], filters)
+
+    return send_file(
+        report,
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name="expenses_report.pdf",
+        max_age=0
+    )
+
+# ------------------ JOBS ------------------
+
+@bp.route("/jobs/<any(expenses_pdf, charts, forecast):kind>", methods=["POST"])
+def create_job(kind):
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    params = request.get_json(silent=True) or request.form.to_dict() or request.args.to_dict()
+
+    if kind == "expenses_pdf":
+        try:
+            services.parse_export_filters(params)
+        except ValueError:
+            return jsonify({"error": "Invalid date filter, expected YYYY-MM-DD"}), 400
+        params = {key: params.get(key) for key in ("from_date", "to_date", "category")}
+    else:
+        params = {}
+
+    job = enqueue_job(session["user_id"], kind, params)
+    return jsonify(job_status(job)), 202
+
+@bp.route("/jobs/<job_id>")
+def job_detail(job_id):
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    job = get_job(job_id, session["user_id"])
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(job_status(job))
+
+@bp.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    if "user_id" not in session:
+        return redirect("/")
+
+    job = get_job(job_id, session["user_id"])
+    if job is None or job["status"] != "done":
+        return "Result not ready", 404
+
+    return send_file(
+        BytesIO(bytes(job["result"])),
+        mimetype=job["result_mimetype"],
+        as_attachment=job["result_filename"] is not None,
+        download_name=job["result_filename"],
+        max_age=0
+    )
@@ -0,0 +1,160 @@
+import io
+import os
+from datetime import datetime
+
+from flask import Blueprint, render_template, request, redirect, session, make_response
+
+from finance import repository, services
+from finance.importers import iter_csv_transactions, iter_ofx_transactions, iter_qif_transactions
+
+bp = Blueprint("transactions", __name__)
+
+# ------------------ TRANSACTION LISTING ------------------
+
+@bp.route("/transactions/<any(income, expense):kind>")
+def transactions_page(kind):
+    if "user_id" not in session:
+        return redirect("/")
+
+    after_id = request.args.get("after_id", type=int)
+    after_date = request.args.get("after_date") or None
+
+    if after_date:
+        try:
+            datetime.strptime(after_date, "%Y-%m-%d")
+        except ValueError:
+            return "Invalid after_date", 400
+
+    rows, next_url = repository.get_transactions_page(session["user_id"], kind, after_date, after_id)
+
+    response = make_response(render_template("transactions_fragment.html", kind=kind, rows=rows))
+    if next_url:
+        response.headers["X-Next-Page"] = next_url
+    return response
+
+# ------------------ ADD INCOME ------------------
+
+@bp.route("/add_income", methods=["GET", "POST"])
+def add_income():
+    if "user_id" not in session:
+        return redirect("/")
+
+    if request.method == "POST":
+        title = request.form["title"]
+        amount = float(request.form["amount"])
+        category = request.form["category"]
+        date = request.form["date"]
+
+        repository.add_transaction(session["user_id"], "income", title, amount, category, date)
+        return redirect("/dashboard")
+
+    return render_template("add_income.html")
+
+# ------------------ ADD EXPENSE ------------------
+
+@bp.route("/add_expense", methods=["GET", "POST"])
+def add_expense():
+    if "user_id" not in session:
+        return redirect("/")
+
+    if request.method == "POST":
+        title = request.form["title"]
+        amount = float(request.form["amount"])
+        category = request.form["category"]
+        date = request.form["date"]
+
+        repository.add_transaction(session["user_id"], "expense", title, amount, category, date)
+        return redirect("/dashboard")
+
+    return render_template("add_expense.html")
+
+# ------------------ EDIT / DELETE ------------------
+
+@bp.route("/delete_expense/<int:expense_id>")
+def delete_expense(expense_id):
+    if "user_id" not in session:
+        return redirect("/")
+
+    repository.delete_transaction(session["user_id"], "expense", expense_id)
+    return redirect("/dashboard")
+
+@bp.route("/delete_income/<int:income_id>")
+def delete_income(income_id):
+    if "user_id" not in session:
+        return redirect("/")
+
+    repository.delete_transaction(session["user_id"], "income", income_id)
+    return redirect("/dashboard")
+
+@bp.route("/edit_expense/<int:expense_id>", methods=["GET", "POST"])
+def edit_expense(expense_id):
+    if "user_id" not in session:
+        return redirect("/")
+
+    expense = repository.get_transaction(session["user_id"], "expense", expense_id)
+
+    if not expense:
+        return redirect("/dashboard")
+
+    if request.method == "POST":
+        repository.update_transaction(
+            session["user_id"], "expense", expense_id,
+            request.form["title"], request.form["amount"], request.form["category"], request.form["date"]
+        )
+        return redirect("/dashboard")
+
+    return render_template("edit_expense.html", expense=expense)
+
+@bp.route("/edit_income/<int:income_id>", methods=["GET", "POST"])
+def edit_income(income_id):
+    if "user_id" not in session:
+        return redirect("/")
+
+    income = repository.get_transaction(session["user_id"], "income", income_id)
+
+    if not income:
+        return redirect("/dashboard")
+
+    if request.method == "POST":
+        repository.update_transaction(
+            session["user_id"], "income", income_id,
+            request.form["title"], request.form["amount"], request.form["category"], request.form["date"]
+        )
+        return redirect("/dashboard")
+
+    return render_template("edit_income.html", income=income)
+
+# ------------------ IMPORT ------------------
+
+@bp.route("/import", methods=["GET", "POST"])
+def import_page():
+    if "user_id" not in session:
+        return redirect("/")
+
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if upload is None or not upload.filename:
+            return render_template("import.html", imported=None, errors=["Choose a file to import."])
+
+        kind = request.form.get("kind", "expense")
+        if kind not in repository.ROLLUP_TABLES:
+            kind = "expense"
+
+        extension = os.path.splitext(upload.filename)[1].lower()
+        stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", errors="replace", newline="")
+
+        try:
+            if extension in (".ofx", ".qfx"):
+                parsed = iter_ofx_transactions(stream)
+            elif extension == ".qif":
+                parsed = iter_qif_transactions(stream)
+            else:
+                parsed = iter_csv_transactions(stream, kind)
+        except ValueError as e:
+            return render_template("import.html", imported=None, errors=[str(e)])
+
+        counts, errors = services.import_transactions(session["user_id"], parsed)
+
+        return render_template("import.html", imported=counts, errors=errors)
+
+    return render_template("import.html", imported=None, errors=[])
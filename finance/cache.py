@@ -0,0 +1,287 @@
+import os
+import json
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from finance import PROJECT_ROOT
+
+# ------------------ METRICS CACHE ------------------
+
+# Per-user totals, balance and health score are cached until the user's data
+# version moves on. Every write bumps the version (and drops the local entry),
+# so a stale entry is never served even when another worker made the change.
+METRICS_CACHE_BACKEND = os.environ.get("METRICS_CACHE_BACKEND", "local")
+METRICS_CACHE_SIZE = int(os.environ.get("METRICS_CACHE_SIZE", 10000))
+METRICS_CACHE_TTL = int(os.environ.get("METRICS_CACHE_TTL", 300))
+
+
+class LocalMetricsCache:
+    """In-process LRU with a TTL."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+
+            expires_at, metrics = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+
+            self._entries.move_to_end(user_id)
+            return metrics
+
+    def set(self, user_id, metrics):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, metrics)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+class RedisMetricsCache:
+    """Shared cache for multi-worker deployments; needs the redis package and REDIS_URL."""
+
+    def __init__(self, url, ttl):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("METRICS_CACHE_BACKEND=redis requires the 'redis' package")
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def _key(self, user_id):
+        return f"finance:metrics:{user_id}"
+
+    def get(self, user_id):
+        value = self.client.get(self._key(user_id))
+        return json.loads(value) if value else None
+
+    def set(self, user_id, metrics):
+        self.client.set(self._key(user_id), json.dumps(metrics), ex=self.ttl)
+
+    def invalidate(self, user_id):
+        self.client.delete(self._key(user_id))
+
+
+if METRICS_CACHE_BACKEND == "redis":
+    metrics_cache = RedisMetricsCache(os.environ.get("REDIS_URL", "redis://localhost:6379/0"), METRICS_CACHE_TTL)
+else:
+    metrics_cache = LocalMetricsCache(METRICS_CACHE_SIZE, METRICS_CACHE_TTL)
+
+# ------------------ PAGE CACHE ------------------
+
+# Rendered dashboard/summary/profile HTML, keyed by (user_id, endpoint) and
+# stored with the ETag it was rendered for, so an entry from an older data
+# version is simply never matched. Off unless PAGE_CACHE_SIZE is set.
+PAGE_CACHE_SIZE = int(os.environ.get("PAGE_CACHE_SIZE", 0))
+PAGE_CACHE_TTL = int(os.environ.get("PAGE_CACHE_TTL", 3600))
+
+page_cache = LocalMetricsCache(PAGE_CACHE_SIZE, PAGE_CACHE_TTL) if PAGE_CACHE_SIZE > 0 else None
+
+# ------------------ CHART CACHE ------------------
+
+CHART_CACHE_MAX_BYTES = int(os.environ.get("CHART_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+CHART_CACHE_DIR = os.environ.get("CHART_CACHE_DIR", os.path.join(PROJECT_ROOT, "instance", "charts"))
+
+class ChartCache:
+    """Per-user chart PNGs: a byte-bounded in-memory LRU in front of content-hashed files.
+
+    Files live at <directory>/<user_id>/<kind>-v<version>-<digest>.png, so workers
+    sharing the directory never overwrite each other and every URL is immutable.
+    """
+
+    def __init__(self, max_bytes, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def filename(kind, version, digest):
+        return f"{kind}-v{version}-{digest}.png"
+
+    @staticmethod
+    def file_version(name):
+        """The data version in a chart filename, or None for anything else."""
+        version = name.partition("-v")[2].partition("-")[0]
+        return int(version) if name.endswith(".png") and version.isdigit() else None
+
+    def _user_dir(self, user_id):
+        return os.path.join(self.directory, str(int(user_id)))
+
+    def get(self, key):
+        """Return (digest, png) for (user_id, kind, version), or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry
+
+        if self.directory:
+            entry = self._read_file(key)
+            if entry is not None:
+                self._remember(key, entry)
+                with self._lock:
+                    self.counters["disk_hits"] += 1
+                return entry
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def _read_file(self, key):
+        user_id, kind, version = key
+        prefix = f"{kind}-v{version}-"
+
+        try:
+            names = os.listdir(self._user_dir(user_id))
+        except OSError:
+            return None
+
+        for name in names:
+            if name.startswith(prefix) and name.endswith(".png"):
+                try:
+                    with open(os.path.join(self._user_dir(user_id), name), "rb") as f:
+                        return name[len(prefix):-len(".png")], f.read()
+                except OSError:
+                    return None
+        return None
+
+    def put(self, key, png):
+        digest = hashlib.sha256(png).hexdigest()[:16]
+        self._remember(key, (digest, png))
+
+        if self.directory:
+            user_id, kind, version = key
+            user_dir = self._user_dir(user_id)
+
+            # Write-then-rename so a concurrent reader never sees a partial file
+            name = self.filename(kind, version, digest)
+            tmp_path = os.path.join(user_dir, f"{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            for attempt in range(3):
+                os.makedirs(user_dir, exist_ok=True)
+                try:
+                    with open(tmp_path, "wb") as f:
+                        f.write(png)
+                    os.replace(tmp_path, os.path.join(user_dir, name))
+                    break
+                except FileNotFoundError:
+                    # sweep() removed the directory in between; recreate it
+                    if attempt == 2:
+                        raise
+
+            # Older versions of this chart can no longer be linked from a dashboard;
+            # newer ones may have just been written by another worker
+            try:
+                names = os.listdir(user_dir)
+            except OSError:
+                names = []
+            for old in names:
+                old_version = self.file_version(old)
+                if old.startswith(f"{kind}-v") and old_version is not None and old_version < version:
+                    try:
+                        os.remove(os.path.join(user_dir, old))
+                    except OSError:
+                        pass
+
+        return digest
+
+    def _remember(self, key, entry):
+        size = len(entry[1])
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1])
+
+            self._entries[key] = entry
+            self._size += size
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[1])
+                self.counters["evictions"] += 1
+
+    def sweep(self, current_versions, max_age=3600):
+        """Delete chart files that no current data version points at.
+
+        current_versions maps user_id -> data version (users missing from it are at
+        version 0). Files for older versions and temp files older than max_age
+        are removed.
+        Returns the number of files deleted.
+        """
+        if not self.directory:
+            return 0
+
+        removed = 0
+        cutoff = time.time() - max_age
+
+        for user_name in os.listdir(self.directory):
+            user_dir = os.path.join(self.directory, user_name)
+            if not user_name.isdigit() or not os.path.isdir(user_dir):
+                continue
+
+            version = current_versions.get(int(user_name), 0)
+            try:
+                names = os.listdir(user_dir)
+            except OSError:
+                continue
+
+            for name in names:
+                path = os.path.join(user_dir, name)
+                try:
+                    if name.endswith(".tmp"):
+                        orphaned = os.path.getmtime(path) < cutoff
+                    else:
+                        # Newer versions are left alone: they were rendered after current_versions was read
+                        file_version = self.file_version(name)
+                        orphaned = file_version is None or file_version < version
+
+                    if orphaned:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+
+            # put() may be writing into it again; it recreates the directory if it has to
+            try:
+                if not os.listdir(user_dir):
+                    os.rmdir(user_dir)
+            except OSError:
+                pass
+
+        return removed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+chart_cache = ChartCache(CHART_CACHE_MAX_BYTES, CHART_CACHE_DIR)
@@ -0,0 +1,58 @@
+# Server-side chart rendering. services.get_chart imports this module only
+# when a chart actually has to be drawn, so matplotlib never loads in workers
+# that just serve auth and CRUD routes.
+from io import BytesIO
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+# Charts are drawn on standalone Figure/Agg canvases, never through pyplot's
+# global state, so any number of threads can render at once.
+CHART_TEMPLATES = {
+    "monthly": {"figsize": (6, 4), "title": "Monthly Expenses", "xlabel": "Month", "ylabel": "Amount"},
+    "category": {"figsize": (6, 4), "title": "Expense by Category", "xlabel": "", "ylabel": ""},
+}
+
+def new_chart_figure(kind):
+    template = CHART_TEMPLATES[kind]
+
+    fig = Figure(figsize=template["figsize"])
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_title(template["title"])
+    ax.set_xlabel(template["xlabel"])
+    ax.set_ylabel(template["ylabel"])
+
+    return fig, ax
+
+def figure_to_png(fig):
+    buffer = BytesIO()
+    fig.tight_layout()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+def render_monthly_expense_png(monthly):
+    fig, ax = new_chart_figure("monthly")
+
+    labels = [str(month) for month in monthly]
+    ax.bar(labels, list(monthly.values()))
+    ax.tick_params(axis="x", labelrotation=90)
+
+    return figure_to_png(fig)
+
+def render_category_pie_png(by_category):
+    fig, ax = new_chart_figure("category")
+
+    ax.pie(list(by_category.values()), labels=[str(c) for c in by_category], autopct="%1.1f%%")
+
+    return figure_to_png(fig)
+
+RENDERERS = {
+    "monthly": render_monthly_expense_png,
+    "category": render_category_pie_png,
+}
+
+def render(kind, series):
+    # Module-level so a chart can be pickled over to a render subprocess
+    return RENDERERS[kind](series)
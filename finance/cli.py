@@ -0,0 +1,241 @@
+import sys
+import json
+import time
+import subprocess
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from finance import PROJECT_ROOT, benchmark, repository, services
+from finance.cache import chart_cache
+from finance.db import run_migrations
+from finance.jobs import start_job_workers
+
+# ------------------ DATABASE ------------------
+
+@click.command("migrate")
+@with_appcontext
+def migrate_command():
+    """Upgrade the database schema in place."""
+    applied = run_migrations()
+    for version, name in applied:
+        print(f"Applied migration {version}: {name}")
+    if not applied:
+        print("Database is up to date.")
+
+@click.command("rollup")
+@click.option("--user-id", type=int, default=None, help="Limit to one user.")
+@click.option("--rebuild", is_flag=True, help="Recompute the rollup instead of only checking it.")
+@with_appcontext
+def rollup_command(user_id, rebuild):
+    """Verify (or rebuild) the monthly rollup against raw transactions."""
+    if rebuild:
+        repository.rebuild_rollup(user_id)
+        print("Rollup rebuilt.")
+
+    drift = repository.verify_rollup(user_id)
+    for row in drift:
+        print(
+            f"user {row['user_id']} {row['kind']} {row['month']} {row['category']!r}: "
+            f"stored {row['stored_total']} ({row['stored_count']}) "
+            f"vs actual {row['actual_total']} ({row['actual_count']})"
+        )
+    print(f"{len(drift)} drifted rollup rows.")
+
+# ------------------ ANALYTICS ------------------
+
+@click.command("sweep-charts")
+@with_appcontext
+def sweep_charts_command():
+    """Remove chart files left behind by old data versions."""
+    removed = chart_cache.sweep(repository.get_data_versions())
+    print(f"Removed {removed} orphaned chart files.")
+
+@click.command("forecast")
+@click.option("--benchmark", is_flag=True, help="Compare against the sklearn per-user path.")
+@with_appcontext
+def forecast_command(benchmark):
+    """Recompute stored forecasts for every user (run nightly)."""
+    started = time.perf_counter()
+    refreshed = services.refresh_forecasts()
+    print(f"Refreshed {refreshed} forecasts in {time.perf_counter() - started:.2f}s.")
+
+    if not benchmark:
+        return
+
+    histories = repository.load_monthly_histories(repository.get_all_user_ids())
+
+    started = time.perf_counter()
+    batch = services.forecast_batch(histories)
+    batch_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    worst = 0.0
+    for user_id, history in histories.items():
+        expected, _ = services.predict_next_month_expense(user_id, monthly=dict(enumerate(history)))
+        if expected is not None:
+            worst = max(worst, abs(expected - batch[user_id][0]))
+    sklearn_seconds = time.perf_counter() - started
+
+    print(f"Batch engine: {batch_seconds:.4f}s for {len(histories)} users.")
+    print(f"sklearn path: {sklearn_seconds:.4f}s.")
+    print(f"Largest difference: {worst:.6f}")
+
+# ------------------ JOBS ------------------
+
+@click.command("run-jobs")
+@click.option("--threads", type=int, default=2, help="Worker threads in this process.")
+@with_appcontext
+def run_jobs_command(threads):
+    """Run a dedicated job worker process."""
+    start_job_workers(threads)
+    print(f"Running {threads} job worker threads. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+@click.command("recurring")
+@click.option("--every", type=float, default=0, help="Keep running, checking every N seconds.")
+@with_appcontext
+def recurring_command(every):
+    """Materialize due recurring transactions for every user (run daily, or with --every)."""
+    while True:
+        started = time.perf_counter()
+        created = services.materialize_recurring()
+        print(f"Materialized {created} recurring transactions in {time.perf_counter() - started:.2f}s.")
+
+        if every <= 0:
+            return
+        time.sleep(every)
+
+# ------------------ STARTUP ------------------
+
+# A worker that only serves auth and CRUD pages must boot without these
+HEAVY_MODULES = ("pandas", "matplotlib", "sklearn", "reportlab")
+LAZY_MODULES = ("finance.charts", "finance.pdf", "finance.forecasting")
+
+def measure_import(statement):
+    """Run statement in a fresh interpreter under -X importtime.
+
+    Returns ({module: cumulative_us}, {top-level import: [modules it pulled in]},
+    loaded module names, peak RSS in KB).
+    """
+    code = (
+        f"{statement}\n"
+        "import sys, json, resource\n"
+        "print(json.dumps([sorted(sys.modules), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    )
+
+    timings = {}
+    pulled_in = {}
+    # Nested imports are printed before the top-level module that triggered them
+    pending = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        top_level = not name[1:].startswith(" ")
+        name = name.strip()
+
+        timings[name] = int(cumulative)
+        if top_level:
+            pulled_in[name] = pending
+            pending = []
+        else:
+            pending.append(name)
+
+    modules, rss = json.loads(result.stdout.splitlines()[-1])
+    return timings, pulled_in, set(modules), rss
+
+@click.command("import-report")
+@click.option("--top", default=10, help="How many of the slowest packages to list.")
+def import_report_command(top):
+    """Time a cold `import app` and fail if a heavy dependency loads eagerly."""
+    timings, pulled_in, modules, rss = measure_import("import app")
+    print(f"import app: {timings['app'] / 1000:.1f} ms, peak RSS {rss / 1024:.1f} MB")
+
+    # Third-party and stdlib packages app pulled in, by their first (full) import cost
+    packages = [
+        (name, timings[name]) for name in pulled_in["app"]
+        if "." not in name and name != "finance"
+    ]
+    slowest = sorted(packages, key=lambda item: item[1], reverse=True)
+    for name, us in slowest[:top]:
+        print(f"  {name:<30} {us / 1000:8.1f} ms")
+
+    # What each lazy module costs the first request that needs it
+    for module in LAZY_MODULES:
+        lazy_timings, _, _, lazy_rss = measure_import(f"import app\nimport {module}")
+        print(f"first use of {module}: +{lazy_timings[module] / 1000:.1f} ms, peak RSS {lazy_rss / 1024:.1f} MB")
+
+    eager = [name for name in HEAVY_MODULES if name in modules]
+    if eager:
+        raise click.ClickException(f"imported eagerly by app: {', '.join(eager)}")
+    print("No heavy modules imported at startup.")
+
+# ------------------ BENCHMARK ------------------
+
+def split_option(value, convert=str):
+    return [convert(item.strip()) for item in value.split(",") if item.strip()]
+
+@click.command("benchmark")
+@click.option("--sizes", default=",".join(map(str, benchmark.BENCHMARK_SIZES)),
+              help="Transactions per synthetic user, comma separated.")
+@click.option("--routes", default=",".join(benchmark.BENCHMARK_ROUTES), help="Routes to drive, comma separated.")
+@click.option("--requests", "request_count", default=20, help="Timed requests per route and size.")
+@click.option("--concurrency", default=4, help="Simultaneous clients.")
+@click.option("--baseline", default=benchmark.BENCHMARK_BASELINE, help="Baseline file to compare against.")
+@click.option("--save", is_flag=True, help="Store this run as the new baseline.")
+@click.option("--tolerance", default=0.25, help="Allowed latency/throughput regression (0.25 = 25%).")
+@click.option("--i-know", is_flag=True,
+              help="Seed into DATABASE_URL when BENCHMARK_DATABASE_URL is unset. Never use on real data.")
+@with_appcontext
+def benchmark_command(sizes, routes, request_count, concurrency, baseline, save, tolerance, i_know):
+    """Seed synthetic users and load-test the hot routes against a baseline."""
+    try:
+        benchmark.use_benchmark_database(i_know)
+        results = benchmark.run_benchmark(
+            current_app._get_current_object(), split_option(sizes, int), split_option(routes),
+            request_count, concurrency
+        )
+    except (ValueError, RuntimeError) as e:
+        raise click.ClickException(str(e))
+
+    if save:
+        benchmark.save_baseline(baseline, results, concurrency)
+        print(f"Baseline written to {baseline}.")
+        return
+
+    stored = benchmark.load_baseline(baseline)
+    if stored is None:
+        print(f"No baseline at {baseline}; rerun with --save to create one.")
+        return
+
+    regressions = benchmark.find_regressions(stored, results, tolerance)
+    for line in regressions:
+        print(f"  {line}")
+    if regressions:
+        raise click.ClickException(f"{len(regressions)} regressions against the baseline from {stored['created']}")
+    print(f"No regressions against the baseline from {stored['created']}.")
+
+COMMANDS = [
+    migrate_command,
+    rollup_command,
+    sweep_charts_command,
+    forecast_command,
+    run_jobs_command,
+    recurring_command,
+    import_report_command,
+    benchmark_command,
+]
+
+def init_app(app):
+    for command in COMMANDS:
+        app.cli.add_command(command)
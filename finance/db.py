@@ -0,0 +1,460 @@
+import os
+import threading
+import time
+
+import psycopg2
+from flask import g
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from finance.instrumentation import CountingConnection, TimedDictCursor, span
+
+# ------------------ DATABASE ------------------
+
+# amount columns are NUMERIC in the database; the app does its arithmetic in floats
+NUMERIC_AS_FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values,
+    "NUMERIC_AS_FLOAT",
+    lambda value, cursor: float(value) if value is not None else None,
+)
+psycopg2.extensions.register_type(NUMERIC_AS_FLOAT)
+
+# DB_POOL_MIN connections are opened at startup; once opened, up to DB_POOL_MAX stay open
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 5))
+DB_POOL_HEALTHCHECK_AFTER = float(os.environ.get("DB_POOL_HEALTHCHECK_AFTER", 30))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 pool that waits for a free slot instead of failing.
+
+    Up to maxconn connections stay open once made: returned ones go on an idle
+    stack and are reused newest first. minconn of them are opened up front.
+    """
+
+    def __init__(self, dsn, minconn, maxconn, timeout, healthcheck_after):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._closed = False
+        self.timeout = timeout
+        self.healthcheck_after = healthcheck_after
+        self.counters = {
+            "checkouts": 0,
+            "connects": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "healthchecks": 0,
+            "discarded": 0,
+        }
+
+        # (connection, time it was returned) pairs; never longer than maxconn
+        now = time.monotonic()
+        self._idle = [(self._connect(), now) for _ in range(min(minconn, maxconn))]
+
+    def _bump(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _connect(self):
+        self._bump("connects")
+        return psycopg2.connect(self.dsn, connection_factory=CountingConnection, cursor_factory=TimedDictCursor)
+
+    def getconn(self):
+        if not self._slots.acquire(blocking=False):
+            self._bump("waits")
+            if not self._slots.acquire(timeout=self.timeout):
+                self._bump("timeouts")
+                raise PoolTimeout(f"No database connection available after {self.timeout}s")
+
+        try:
+            conn = self._checkout_healthy()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.counters["checkouts"] += 1
+            self._in_use += 1
+        return conn
+
+    def _checkout_healthy(self):
+        with self._lock:
+            conn, idle_since = self._idle.pop() if self._idle else (None, None)
+
+        if conn is None:
+            return self._connect()
+
+        # Only ping connections that sat idle long enough to have been dropped
+        if conn.closed or (time.monotonic() - idle_since > self.healthcheck_after and not self._ping(conn)):
+            self._bump("discarded")
+            self._close(conn)
+            return self._connect()
+
+        return conn
+
+    def _ping(self, conn):
+        self._bump("healthchecks")
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def putconn(self, conn):
+        try:
+            broken = bool(conn.closed)
+            if not broken and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+
+            with self._lock:
+                self._in_use -= 1
+                keep = not broken and not self._closed
+                if keep:
+                    self._idle.append((conn, time.monotonic()))
+            if not keep:
+                self._close(conn)
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["in_use"] = self._in_use
+            stats["idle"] = len(self._idle)
+        stats["max_size"] = self.maxconn
+        stats["min_size"] = self.minconn
+        return stats
+
+    def closeall(self):
+        """Close the idle connections; ones still checked out are closed as they come back."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+def get_db_pool():
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = ConnectionPool(
+                    os.environ.get("DATABASE_URL"),
+                    DB_POOL_MIN,
+                    DB_POOL_MAX,
+                    DB_POOL_TIMEOUT,
+                    DB_POOL_HEALTHCHECK_AFTER,
+                )
+    return _db_pool
+
+
+def use_database(dsn):
+    """Point the pool at another database; only for tools (the benchmark) that run before any query."""
+    global _db_pool
+    with _db_pool_lock:
+        previous, _db_pool = _db_pool, ConnectionPool(
+            dsn, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_HEALTHCHECK_AFTER
+        )
+    if previous is not None:
+        previous.closeall()
+
+
+def get_db_connection():
+    # One pooled connection per app context, handed back in release_db_connection
+    if "db_conn" not in g:
+        with span("db_checkout", "getconn"):
+            g.db_conn = get_db_pool().getconn()
+    return g.db_conn
+
+
+def release_db_connection(exception):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        get_db_pool().putconn(conn)
+
+def init_app(app):
+    app.teardown_appcontext(release_db_connection)
+
+# ------------------ MIGRATIONS ------------------
+
+# monthly_rollup rows as computed from raw transactions (see the ROLLUP section)
+ROLLUP_SELECT_SQL = """
+    SELECT user_id, '{kind}'::text AS kind, date_trunc('month', date)::date AS month,
+           COALESCE(category, '') AS category, SUM(amount) AS total, COUNT(*) AS count
+    FROM {table}
+    WHERE user_id IS NOT NULL AND date IS NOT NULL AND amount IS NOT NULL {user_filter}
+    GROUP BY 1, 3, 4
+"""
+
+ROLLUP_BACKFILL_SQL = (
+    "INSERT INTO monthly_rollup (user_id, kind, month, category, total, count)" + ROLLUP_SELECT_SQL
+)
+
+# Each migration runs once, in order, inside its own transaction. Append new
+# entries to the end; never edit one that has already shipped.
+MIGRATIONS = [
+    (1, "initial_schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username TEXT UNIQUE,
+            password TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS income (
+            id SERIAL PRIMARY KEY,
+            title TEXT,
+            amount REAL,
+            category TEXT,
+            date TEXT,
+            user_id INTEGER
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS expenses (
+            id SERIAL PRIMARY KEY,
+            title TEXT,
+            amount REAL,
+            category TEXT,
+            date TEXT,
+            user_id INTEGER
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS budget (
+            id SERIAL PRIMARY KEY,
+            month TEXT,
+            amount REAL,
+            user_id INTEGER
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS data_version (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+    ]),
+    (2, "typed_dates_and_amounts", [
+        """
+        ALTER TABLE income
+            ALTER COLUMN date TYPE DATE USING NULLIF(date, '')::date,
+            ALTER COLUMN amount TYPE NUMERIC(12, 2) USING round(amount::numeric, 2)
+        """,
+        """
+        ALTER TABLE expenses
+            ALTER COLUMN date TYPE DATE USING NULLIF(date, '')::date,
+            ALTER COLUMN amount TYPE NUMERIC(12, 2) USING round(amount::numeric, 2)
+        """,
+        """
+        ALTER TABLE budget
+            ALTER COLUMN amount TYPE NUMERIC(12, 2) USING round(amount::numeric, 2)
+        """,
+    ]),
+    (3, "user_date_and_category_indexes", [
+        "CREATE INDEX IF NOT EXISTS income_user_date_idx ON income (user_id, date)",
+        "CREATE INDEX IF NOT EXISTS expenses_user_date_idx ON expenses (user_id, date)",
+        "CREATE INDEX IF NOT EXISTS income_user_category_idx ON income (user_id, category)",
+        "CREATE INDEX IF NOT EXISTS expenses_user_category_idx ON expenses (user_id, category)",
+    ]),
+    (4, "unique_budget_per_month", [
+        # Keep the most recent row when a month was saved more than once
+        """
+        DELETE FROM budget a
+        USING budget b
+        WHERE a.user_id = b.user_id AND a.month = b.month AND a.id < b.id
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS budget_user_month_key ON budget (user_id, month)",
+    ]),
+    (5, "monthly_rollup", [
+        """
+        CREATE TABLE IF NOT EXISTS monthly_rollup (
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            month DATE NOT NULL,
+            category TEXT NOT NULL,
+            total NUMERIC(14, 2) NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, kind, month, category)
+        )
+        """,
+        "DELETE FROM monthly_rollup",
+        ROLLUP_BACKFILL_SQL.format(table="income", kind="income", user_filter=""),
+        ROLLUP_BACKFILL_SQL.format(table="expenses", kind="expense", user_filter=""),
+    ]),
+    (6, "keyset_listing_indexes", [
+        # (user_id, date, id) serves keyset pages and everything (user_id, date) did
+        "CREATE INDEX IF NOT EXISTS income_user_date_id_idx ON income (user_id, date, id)",
+        "CREATE INDEX IF NOT EXISTS expenses_user_date_id_idx ON expenses (user_id, date, id)",
+        "DROP INDEX IF EXISTS income_user_date_idx",
+        "DROP INDEX IF EXISTS expenses_user_date_idx",
+    ]),
+    (7, "jobs", [
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            params JSONB NOT NULL DEFAULT '{}',
+            cache_key TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            run_after TIMESTAMP NOT NULL DEFAULT now(),
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            error TEXT,
+            result BYTEA,
+            result_mimetype TEXT,
+            result_filename TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS jobs_queue_idx ON jobs (status, run_after)",
+        "CREATE INDEX IF NOT EXISTS jobs_user_cache_key_idx ON jobs (user_id, cache_key)",
+    ]),
+    (8, "forecasts", [
+        """
+        CREATE TABLE IF NOT EXISTS forecasts (
+            user_id INTEGER PRIMARY KEY,
+            data_version INTEGER NOT NULL,
+            predicted DOUBLE PRECISION,
+            note TEXT NOT NULL,
+            months INTEGER NOT NULL,
+            computed_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+        """,
+    ]),
+    (9, "data_version_updated_at", [
+        # Drives Last-Modified on the versioned pages
+        "ALTER TABLE data_version ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+    ]),
+    (10, "category_and_recurring_budgets", [
+        # '' is the whole month's budget, as before
+        "ALTER TABLE budget ADD COLUMN IF NOT EXISTS category TEXT NOT NULL DEFAULT ''",
+        "CREATE UNIQUE INDEX IF NOT EXISTS budget_user_month_category_key ON budget (user_id, month, category)",
+        "DROP INDEX IF EXISTS budget_user_month_key",
+        """
+        CREATE TABLE IF NOT EXISTS recurring_budgets (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL DEFAULT '',
+            amount NUMERIC(12, 2) NOT NULL,
+            PRIMARY KEY (user_id, category)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS budget_alerts (
+            user_id INTEGER NOT NULL,
+            month DATE NOT NULL,
+            category TEXT NOT NULL,
+            threshold INTEGER NOT NULL,
+            spent NUMERIC(12, 2) NOT NULL,
+            budget NUMERIC(12, 2) NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (user_id, month, category, threshold)
+        )
+        """,
+    ]),
+    (11, "recurring_rules", [
+        """
+        CREATE TABLE IF NOT EXISTS recurring_rules (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            title TEXT,
+            amount NUMERIC(12, 2) NOT NULL,
+            category TEXT,
+            frequency TEXT NOT NULL,
+            repeat_every INTEGER NOT NULL DEFAULT 1,
+            start_date DATE NOT NULL,
+            end_date DATE,
+            next_index INTEGER NOT NULL DEFAULT 0,
+            next_date DATE NOT NULL,
+            active BOOLEAN NOT NULL DEFAULT true,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS recurring_rules_due_idx ON recurring_rules (next_date, id) WHERE active",
+        "CREATE INDEX IF NOT EXISTS recurring_rules_user_idx ON recurring_rules (user_id)",
+        # One row per materialized occurrence, so a rerun never inserts it twice
+        """
+        CREATE TABLE IF NOT EXISTS recurring_occurrences (
+            rule_id INTEGER NOT NULL REFERENCES recurring_rules (id) ON DELETE CASCADE,
+            period DATE NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (rule_id, period)
+        )
+        """,
+    ]),
+]
+
+MIGRATION_LOCK_ID = 715_001
+
+def run_migrations():
+    """Apply pending migrations and return the (version, name) pairs that ran."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """)
+    conn.commit()
+
+    applied = []
+    for version, name, statements in MIGRATIONS:
+        try:
+            # Serializes concurrent runners (e.g. several workers booting); released at commit
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if cursor.fetchone():
+                conn.commit()
+                continue
+
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        applied.append((version, name))
+
+    return applied
+
+def init_db():
+    run_migrations()
@@ -0,0 +1,100 @@
+# Expense forecasting. services imports this module only when a forecast has
+# to be fitted; pandas and scikit-learn are pulled in further down, by the
+# reference path alone, which only the `flask forecast --benchmark` run uses.
+import numpy as np
+
+
+def monthly_features(history):
+    import pandas as pd
+
+    monthly = pd.DataFrame({"amount": pd.Series(history, dtype=float)})
+    monthly["time_index"] = range(1, len(monthly) + 1)
+
+    X = monthly[["time_index"]]
+    y = monthly["amount"]
+
+    return X, y
+
+def predict_next_month(history):
+    """Fit one user's monthly totals with scikit-learn; returns (predicted, note)."""
+    from sklearn.linear_model import LinearRegression
+
+    if len(history) == 0:
+        return None, "Not enough data to predict."
+
+    if len(history) == 1:
+        return float(history[0]), "Only one month data. Prediction equals last month."
+
+    X, y = monthly_features(history)
+
+    model = LinearRegression()
+    model.fit(X, y)
+
+    next_index = X["time_index"].max() + 1
+    predicted = model.predict([[next_index]])[0]
+
+    min_expense = min(history)
+    max_expense = max(history)
+    avg_expense = sum(history) / len(history)
+
+    smart_min = min(min_expense * 0.7, avg_expense * 0.5)
+    smart_max = max_expense * 1.5
+
+    if predicted < smart_min:
+        predicted = smart_min
+    if predicted > smart_max:
+        predicted = smart_max
+
+    return float(predicted), f"Prediction based on {len(history)} months of data."
+
+# Forecasts are fitted for many users at once with closed-form least squares
+# over a stacked (users x months) matrix. predict_next_month above stays as
+# the scikit-learn reference the batch engine is benchmarked against.
+def forecast_batch(histories):
+    """Forecast next month for each user.
+
+    histories maps user_id -> monthly expense totals in month order. Returns
+    user_id -> (predicted, note, months), matching predict_next_month.
+    """
+    user_ids = list(histories)
+    if not user_ids:
+        return {}
+
+    counts = np.array([len(histories[u]) for u in user_ids])
+    width = max(int(counts.max()), 1)
+
+    # Left-aligned matrix: row i holds user i's months in columns 0..n_i-1
+    mask = np.arange(width) < counts[:, None]
+    y = np.zeros((len(user_ids), width))
+    y[mask] = np.concatenate([np.asarray(histories[u], dtype=float) for u in user_ids])
+
+    n = counts.astype(float)
+    x = np.arange(1, width + 1, dtype=float)
+    sum_x = n * (n + 1) / 2
+    sum_xx = n * (n + 1) * (2 * n + 1) / 6
+    sum_y = y.sum(axis=1)
+    sum_xy = (y * x).sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = n * sum_xx - sum_x ** 2
+        slope = np.where(denominator > 0, (n * sum_xy - sum_x * sum_y) / denominator, 0.0)
+        intercept = np.where(n > 0, (sum_y - slope * sum_x) / n, 0.0)
+        average = np.where(n > 0, sum_y / n, 0.0)
+
+    predicted = intercept + slope * (n + 1)
+
+    # Same guard rails as the sklearn path
+    smart_min = np.minimum(np.where(mask, y, np.inf).min(axis=1) * 0.7, average * 0.5)
+    smart_max = np.where(mask, y, -np.inf).max(axis=1) * 1.5
+    predicted = np.minimum(np.maximum(predicted, smart_min), smart_max)
+    predicted = np.where(counts == 1, y[:, 0], predicted)
+
+    results = {}
+    for user_id, months, value in zip(user_ids, counts.tolist(), predicted.tolist()):
+        if months == 0:
+            results[user_id] = (None, "Not enough data to predict.", 0)
+        elif months == 1:
+            results[user_id] = (value, "Only one month data. Prediction equals last month.", 1)
+        else:
+            results[user_id] = (value, f"Prediction based on {months} months of data.", months)
+    return results
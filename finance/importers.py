@@ -0,0 +1,147 @@
+import io
+import csv
+from datetime import datetime
+
+# ------------------ IMPORT ------------------
+
+IMPORT_MAX_ERRORS = 20
+IMPORT_DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y"]
+QIF_DATE_FORMATS = ["%m/%d/%Y", "%m/%d/%y", "%m/%d'%y", "%m/%d' %y", "%Y-%m-%d"]
+
+def parse_import_amount(value):
+    value = (value or "").strip().replace(",", "").replace("₹", "").replace(" ", "")
+    amount = float(value)
+    if amount != amount or abs(amount) >= 10 ** 10:
+        raise ValueError("amount out of range")
+    return round(amount, 2)
+
+def clean_import_text(value):
+    # PostgreSQL text can't hold NUL, and COPY would reject the whole file for one
+    return (value or "").replace("\x00", "").strip()
+
+def parse_import_date(value, formats):
+    value = (value or "").strip()
+    for fmt in formats:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"unrecognised date {value!r}")
+
+def iter_csv_transactions(stream, kind):
+    # The header is checked up front so a wrong file fails before any COPY starts
+    reader = csv.reader(stream)
+    try:
+        header = [column.strip().lower() for column in next(reader, [])]
+    except csv.Error as e:
+        raise ValueError(f"Could not read the CSV file: {e}")
+
+    try:
+        columns = [header.index(name) for name in ("title", "amount", "category", "date")]
+    except ValueError:
+        raise ValueError("CSV header must include Title, Amount, Category and Date")
+
+    def rows():
+        line = 1
+        try:
+            for line, row in enumerate(reader, start=2):
+                if not any(cell.strip() for cell in row):
+                    continue
+                try:
+                    if len(row) <= max(columns):
+                        raise ValueError(f"expected {len(header)} columns, found {len(row)}")
+                    title, amount, category, date = (row[i] for i in columns)
+                    amount = parse_import_amount(amount)
+                    if amount < 0:
+                        raise ValueError("negative amount (import refunds as income)")
+                    yield line, (kind, clean_import_text(title), amount, clean_import_text(category),
+                                 parse_import_date(date, IMPORT_DATE_FORMATS))
+                except ValueError as e:
+                    yield line, e
+        except csv.Error as e:
+            # Malformed CSV (e.g. an oversized field) ends the file, not just the row
+            yield None, ValueError(f"Could not read the CSV file after line {line}: {e}")
+
+    return rows()
+
+def iter_ofx_transactions(stream):
+    # OFX 1.x is SGML, so closing tags are optional; read <TAG>value pairs per <STMTTRN>
+    fields = None
+    for line, text in enumerate(stream, start=1):
+        for chunk in text.replace("<", "\n<").splitlines():
+            chunk = chunk.strip()
+            tag, _, value = chunk.partition(">")
+            tag = tag.lstrip("<").upper()
+
+            if tag == "STMTTRN":
+                fields = {"line": line}
+            elif tag == "/STMTTRN" and fields is not None:
+                try:
+                    amount = parse_import_amount(fields.get("TRNAMT"))
+                    yield fields["line"], (
+                        "expense" if amount < 0 else "income",
+                        clean_import_text(fields.get("NAME") or fields.get("MEMO")),
+                        abs(amount),
+                        clean_import_text(fields.get("TRNTYPE")).title(),
+                        parse_import_date(fields.get("DTPOSTED", "")[:8], ["%Y%m%d"]),
+                    )
+                except ValueError as e:
+                    yield fields["line"], e
+                fields = None
+            elif fields is not None and value.strip():
+                fields[tag] = value.strip()
+
+def iter_qif_transactions(stream):
+    fields = {}
+    start = 1
+    for line, text in enumerate(stream, start=1):
+        text = text.rstrip("\r\n")
+        if not text or text.startswith("!"):
+            continue
+
+        code, value = text[0], text[1:].strip()
+        if code != "^":
+            fields.setdefault(code, value)
+            continue
+
+        if fields:
+            try:
+                amount = parse_import_amount(fields.get("T") or fields.get("U"))
+                yield start, (
+                    "expense" if amount < 0 else "income",
+                    clean_import_text(fields.get("P") or fields.get("M")),
+                    abs(amount),
+                    clean_import_text(fields.get("L")),
+                    parse_import_date(fields.get("D"), QIF_DATE_FORMATS),
+                )
+            except ValueError as e:
+                yield start, e
+        fields = {}
+        start = line + 1
+
+
+class RowStream:
+    """File-like object that feeds csv rows to copy_expert as they are produced."""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._pending = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self._pending += self._buffer.getvalue()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+
+        if size < 0:
+            size = len(self._pending)
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+    readline = read
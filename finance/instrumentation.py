@@ -0,0 +1,408 @@
+import os
+import re
+import sys
+import json
+import time
+import hmac
+import hashlib
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from flask import g, request, Response, before_render_template, template_rendered
+
+from finance import PROJECT_ROOT
+
+# Every request carries a trace: one span per DB query (by SQL fingerprint),
+# connection checkout, chart render, forecast fit and template render. Spans
+# feed process-wide Prometheus counters served at /metrics, and optionally a
+# Server-Timing header. Metrics are per process; scrape every worker.
+# /metrics is only served once METRICS_TOKEN is set, to scrapers sending it
+# as a bearer token; it names endpoints and SQL shapes, so it is never public.
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"
+DEBUG_SPANS = os.environ.get("DEBUG_SPANS", "0") == "1"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+QUERY_LABEL_CHARS = int(os.environ.get("QUERY_LABEL_CHARS", 80))
+
+# Requests slower than this get their sampled stacks logged and written out (0 disables)
+PROFILE_SLOW_REQUESTS_MS = float(os.environ.get("PROFILE_SLOW_REQUESTS_MS", 0))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.005))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(PROJECT_ROOT, "instance", "profiles"))
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# ------------------ METRICS REGISTRY ------------------
+
+METRIC_HELP = {
+    "finance_requests_total": ("counter", "HTTP requests by endpoint, method and status."),
+    "finance_request_duration_seconds": ("histogram", "Time spent in the view, by endpoint."),
+    "finance_db_queries_total": ("counter", "Queries executed, by SQL fingerprint."),
+    "finance_db_query_rows_total": ("counter", "Rows returned or affected, by SQL fingerprint."),
+    "finance_db_query_duration_seconds": ("histogram", "Query execution time, by SQL fingerprint."),
+    "finance_db_connections_opened_total": ("counter", "Physical database connections opened."),
+    "finance_span_duration_seconds": ("histogram", "Chart, forecast, checkout and render spans."),
+}
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms rendered in the Prometheus text format."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            self._counters[(name, labels)] += value
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                # Per-bucket counts, then sum and count
+                histogram = self._histograms[(name, labels)] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def total(self, name):
+        """Sum of a counter across all of its label sets."""
+        with self._lock:
+            return sum(value for (key, _), value in self._counters.items() if key == name)
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in pairs) + "}"
+
+    def render(self, gauges):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(value) for key, value in self._histograms.items()}
+
+        by_name = defaultdict(list)
+        for (name, labels), value in counters.items():
+            by_name[name].append(f"{name}{self._labels(labels)} {value:g}")
+        for (name, labels), histogram in histograms.items():
+            for bound, count in zip(self.buckets, histogram):
+                by_name[name].append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {count}")
+            by_name[name].append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {histogram[-1]}")
+            by_name[name].append(f"{name}_sum{self._labels(labels)} {histogram[-2]:.6f}")
+            by_name[name].append(f"{name}_count{self._labels(labels)} {histogram[-1]}")
+        for name, value in gauges.items():
+            by_name[name].append(f"{name} {value:g}")
+
+        lines = []
+        for name in sorted(by_name):
+            kind, help_text = METRIC_HELP.get(name, ("gauge", name.replace("_", " ")))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(sorted(by_name[name]))
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry(DURATION_BUCKETS)
+
+# ------------------ TRACES ------------------
+
+# The trace of the request this thread is serving, if any. Chart renders run
+# on pool threads, so propagate() carries the trace over to them.
+_local = threading.local()
+
+
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.connections_opened = 0
+
+    def add(self, kind, name, seconds, rows=None):
+        self.spans.append((kind, name, seconds, rows))
+
+    def totals(self):
+        """kind -> (seconds, count)"""
+        totals = defaultdict(lambda: [0.0, 0])
+        for kind, _, seconds, _ in self.spans:
+            totals[kind][0] += seconds
+            totals[kind][1] += 1
+        return totals
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+def propagate(fn):
+    """Wrap fn so spans it records on another thread land in the caller's trace."""
+    trace = current_trace()
+
+    @wraps(fn)
+    def run(*args, **kwargs):
+        previous = current_trace()
+        _local.trace = trace
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.trace = previous
+
+    return run
+
+@contextmanager
+def span(kind, name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        registry.observe("finance_span_duration_seconds", (("kind", kind), ("name", name)), seconds)
+        trace = current_trace()
+        if trace is not None:
+            trace.add(kind, name, seconds)
+
+# ------------------ QUERIES ------------------
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """Collapse a statement to its shape: literals become ?, VALUES lists one tuple."""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = " ".join(sql.split())
+    sql = re.sub(r"(\([^()]*\))(?:\s*,\s*\([^()]*\))+", r"\1, ...", sql)
+    # Long statements can share a prefix, so the label ends with a digest of the whole shape
+    digest = hashlib.sha1(sql.encode()).hexdigest()[:8]
+    label = sql if len(sql) <= QUERY_LABEL_CHARS else sql[:QUERY_LABEL_CHARS - 1] + "…"
+    return f"{label} [{digest}]"
+
+def record_query(sql, seconds, rows):
+    query = fingerprint(sql if isinstance(sql, (str, bytes)) else str(sql))
+    labels = (("query", query),)
+    registry.inc("finance_db_queries_total", labels)
+    registry.observe("finance_db_query_duration_seconds", labels, seconds)
+    if rows is not None and rows >= 0:
+        registry.inc("finance_db_query_rows_total", labels, rows)
+
+    trace = current_trace()
+    if trace is not None:
+        trace.add("db", query, seconds, rows)
+
+
+class TimedCursorMixin:
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(query, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(query, time.perf_counter() - started, self.rowcount)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record_query(sql, time.perf_counter() - started, self.rowcount)
+
+
+class TimedDictCursor(TimedCursorMixin, RealDictCursor):
+    pass
+
+
+class TimedCursor(TimedCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    """Connection class that counts physical connections as they are opened."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        registry.inc("finance_db_connections_opened_total")
+        trace = current_trace()
+        if trace is not None:
+            trace.connections_opened += 1
+
+# ------------------ SLOW REQUEST PROFILER ------------------
+
+def fold_stack(frame, limit=64):
+    """Render a frame chain as a root-first folded stack (flamegraph.pl input)."""
+    names = []
+    while frame is not None and len(names) < limit:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SlowRequestProfiler(threading.Thread):
+    """Samples the stacks of in-flight request threads; kept only for slow requests."""
+
+    def __init__(self, interval):
+        super().__init__(daemon=True, name="request-profiler")
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def track(self, ident):
+        with self._lock:
+            self._active[ident] = Counter()
+
+    def finish(self, ident):
+        with self._lock:
+            return self._active.pop(ident, None)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[fold_stack(frame)] += 1
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+def get_profiler():
+    global _profiler
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                _profiler = SlowRequestProfiler(PROFILE_SAMPLE_INTERVAL)
+                _profiler.start()
+    return _profiler
+
+def save_profile(app, endpoint, seconds, samples):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{int(seconds * 1000)}ms.folded")
+    with open(path, "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+
+    hottest = samples.most_common(1)[0]
+    app.logger.warning(
+        "Slow request %s took %.0f ms; %d samples written to %s; hottest stack (%d): %s",
+        endpoint, seconds * 1000, sum(samples.values()), path, hottest[1], hottest[0]
+    )
+
+# ------------------ REQUEST HOOKS ------------------
+
+def server_timing(trace, total):
+    entries = [
+        f'{kind};dur={seconds * 1000:.1f};desc="{count} {kind} spans"'
+        for kind, (seconds, count) in sorted(trace.totals().items())
+    ]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+def start_trace():
+    _local.trace = Trace()
+    if PROFILE_SLOW_REQUESTS_MS > 0:
+        get_profiler().track(threading.get_ident())
+
+def finish_trace(response):
+    trace = current_trace()
+    if trace is None:
+        return response
+
+    total = time.perf_counter() - trace.started
+    endpoint = request.endpoint or "unknown"
+    registry.inc(
+        "finance_requests_total",
+        (("endpoint", endpoint), ("method", request.method), ("status", response.status_code))
+    )
+    registry.observe("finance_request_duration_seconds", (("endpoint", endpoint),), total)
+
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = server_timing(trace, total)
+    if DEBUG_SPANS:
+        response.headers["X-Debug-Spans"] = json.dumps({
+            "connections_opened": trace.connections_opened,
+            "spans": [
+                {"kind": kind, "name": name, "ms": round(seconds * 1000, 2), "rows": rows}
+                for kind, name, seconds, rows in trace.spans
+            ],
+        }, ensure_ascii=True)
+
+    g.request_seconds = total
+    return response
+
+def end_trace(exception):
+    trace = current_trace()
+    _local.trace = None
+
+    if trace is None or PROFILE_SLOW_REQUESTS_MS <= 0:
+        return
+
+    samples = get_profiler().finish(threading.get_ident())
+    seconds = g.get("request_seconds", time.perf_counter() - trace.started)
+    if samples and seconds * 1000 >= PROFILE_SLOW_REQUESTS_MS:
+        from flask import current_app
+        save_profile(current_app, request.endpoint or "unknown", seconds, samples)
+
+def render_started(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+def render_finished(sender, template, context, **extra):
+    started = g.pop("render_started", None)
+    if started is None:
+        return
+
+    seconds = time.perf_counter() - started
+    name = template.name or "template"
+    registry.observe("finance_span_duration_seconds", (("kind", "render"), ("name", name)), seconds)
+    trace = current_trace()
+    if trace is not None:
+        trace.add("render", name, seconds)
+
+# ------------------ /metrics ------------------
+
+def collect_gauges():
+    from finance import db
+    from finance.cache import chart_cache
+
+    gauges = {}
+    if db._db_pool is not None:
+        for key, value in db._db_pool.stats().items():
+            gauges[f"finance_db_pool_{key}"] = value
+    for key, value in chart_cache.stats().items():
+        gauges[f"finance_chart_cache_{key}"] = value
+    return gauges
+
+def metrics_view():
+    if not METRICS_TOKEN:
+        return "Not Found", 404
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        return "Forbidden", 403
+
+    return Response(registry.render(collect_gauges()), mimetype="text/plain; version=0.0.4")
+
+def init_app(app):
+    app.before_request(start_trace)
+    app.after_request(finish_trace)
+    app.teardown_request(end_trace)
+    before_render_template.connect(render_started, app)
+    template_rendered.connect(render_finished, app)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -0,0 +1,271 @@
+import os
+import json
+import uuid
+import threading
+import multiprocessing
+
+import psycopg2
+from flask import current_app
+
+from finance import repository, services
+from finance.db import get_db_connection, release_db_connection
+
+# ------------------ JOBS ------------------
+
+# Heavy work (PDF reports, chart rendering, forecasts) runs off the request
+# thread. Jobs live in the jobs table, so any web worker can poll a job that
+# another process ran; workers claim them with FOR UPDATE SKIP LOCKED.
+#
+# Each handler runs in its own spawned process, which is killed once it
+# overruns JOB_TIMEOUT, and its queries carry a matching statement_timeout.
+# reap_jobs only has to catch runs whose worker died outright; it waits an
+# extra JOB_REAP_GRACE so it never requeues a run that is still being killed.
+JOB_INLINE_WORKERS = int(os.environ.get("JOB_INLINE_WORKERS", 1))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1))
+JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT", 300))
+JOB_REAP_GRACE = int(os.environ.get("JOB_REAP_GRACE", 30))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_DELAY = int(os.environ.get("JOB_RETRY_DELAY", 5))
+JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", 3600))
+
+def run_expenses_pdf_job(user_id, params):
+    report = services.build_expenses_pdf(user_id, services.parse_export_filters(params))
+    return report.read(), "application/pdf", "expenses_report.pdf"
+
+def run_charts_job(user_id, params):
+    charts = {
+        "monthly": services.generate_monthly_expense_chart(user_id),
+        "category": services.generate_category_pie_chart(user_id),
+    }
+    return json.dumps(charts).encode(), "application/json", None
+
+def run_forecast_job(user_id, params):
+    services.refresh_forecasts([user_id])
+    forecast = repository.get_stored_forecast(user_id)
+
+    predicted, note = forecast["predicted"], forecast["note"]
+    return json.dumps({"predicted_expense": predicted, "note": note}).encode(), "application/json", None
+
+JOB_HANDLERS = {
+    "expenses_pdf": run_expenses_pdf_job,
+    "charts": run_charts_job,
+    "forecast": run_forecast_job,
+}
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def run_job_process(sender, kind, user_id, params, timeout):
+    """Child process entry point: run one handler in a fresh app and send back its result."""
+    from finance import create_app
+
+    app = create_app()
+    try:
+        with app.app_context():
+            conn = get_db_connection()
+            conn.cursor().execute("SET statement_timeout = %s", (int(timeout * 1000),))
+            conn.commit()
+            sender.send(("done", JOB_HANDLERS[kind](user_id, params)))
+    except Exception as e:
+        app.logger.exception("Job handler %s failed", kind)
+        sender.send(("failed", str(e) or type(e).__name__))
+    finally:
+        sender.close()
+
+def call_job_handler(kind, user_id, params, timeout):
+    """Run kind's handler in a spawned process, terminating it when it overruns timeout seconds."""
+    # spawn: the child builds its own app and pool, so it needs nothing of this process's state
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=run_job_process, args=(sender, kind, user_id, params, timeout), name=f"job-{kind}"
+    )
+    process.start()
+    sender.close()
+
+    try:
+        if not receiver.poll(timeout):
+            process.terminate()
+            raise JobTimeout(f"Timed out after {timeout}s")
+        status, value = receiver.recv()
+    except EOFError:
+        status, value = "failed", "Job process exited without a result"
+    finally:
+        process.join()
+        receiver.close()
+
+    if status == "failed":
+        raise RuntimeError(value)
+    return value
+
+def enqueue_job(user_id, kind, params):
+    """Queue a job, or return an equivalent queued, running or fresh finished one."""
+    params = {key: value for key, value in sorted(params.items()) if value}
+    cache_key = f"{kind}:{repository.get_data_version(user_id)}:{json.dumps(params, sort_keys=True)}"
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    # Reaping here too means a stuck worker can't hide its own overrun
+    reap_jobs(cursor)
+    cursor.execute("""
+        SELECT * FROM jobs
+        WHERE user_id = %s AND cache_key = %s
+          AND (status IN ('queued', 'running')
+               OR (status = 'done' AND finished_at > now() - make_interval(secs => %s)))
+        ORDER BY created_at DESC
+        LIMIT 1
+    """, (user_id, cache_key, JOB_RESULT_TTL))
+    job = cursor.fetchone()
+
+    if job is None:
+        cursor.execute("""
+            INSERT INTO jobs (id, user_id, kind, params, cache_key, max_attempts)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING *
+        """, (uuid.uuid4().hex, user_id, kind, json.dumps(params), cache_key, JOB_MAX_ATTEMPTS))
+        job = cursor.fetchone()
+
+    conn.commit()
+    start_job_workers()
+    return job
+
+def get_job(job_id, user_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    reap_jobs(cursor, job_id)
+    cursor.execute("SELECT * FROM jobs WHERE id = %s AND user_id = %s", (job_id, user_id))
+    job = cursor.fetchone()
+    conn.commit()
+    return job
+
+def reap_jobs(cursor, job_id=None):
+    """Retry (or fail) runs abandoned past their timeout; just job_id's when given."""
+    # Their late results are ignored, since the attempt number has moved on
+    cursor.execute("""
+        UPDATE jobs
+        SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+            error = 'Timed out',
+            finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE now() END
+        WHERE status = 'running' AND started_at < now() - make_interval(secs => %s)
+          AND (%s IS NULL OR id = %s)
+    """, (JOB_TIMEOUT + JOB_REAP_GRACE, job_id, job_id))
+
+    if job_id is not None:
+        return
+
+    cursor.execute("""
+        DELETE FROM jobs
+        WHERE status IN ('done', 'failed') AND finished_at < now() - make_interval(secs => %s)
+    """, (JOB_RESULT_TTL,))
+
+def run_next_job():
+    """Claim and run one due job. Returns False when the queue is empty."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    reap_jobs(cursor)
+    cursor.execute("""
+        UPDATE jobs
+        SET status = 'running', attempts = attempts + 1, started_at = now(), error = NULL
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE status = 'queued' AND run_after <= now()
+            ORDER BY created_at
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING id, user_id, kind, params, attempts, max_attempts
+    """)
+    job = cursor.fetchone()
+    conn.commit()
+
+    if job is None:
+        return False
+
+    # The child opens its own connections, so hand this one back to the pool
+    # for the length of the run instead of holding it idle
+    release_db_connection(None)
+    try:
+        result, mimetype, filename = call_job_handler(job["kind"], job["user_id"], job["params"], JOB_TIMEOUT)
+    except Exception as e:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        current_app.logger.error("Job %s (%s) failed: %s", job["id"], job["kind"], e)
+
+        retry = job["attempts"] < job["max_attempts"]
+        cursor.execute("""
+            UPDATE jobs
+            SET status = %s, error = %s,
+                run_after = now() + make_interval(secs => %s),
+                finished_at = CASE WHEN %s THEN NULL ELSE now() END
+            WHERE id = %s AND status = 'running' AND attempts = %s
+        """, (
+            "queued" if retry else "failed", str(e) or type(e).__name__,
+            JOB_RETRY_DELAY * job["attempts"], retry, job["id"], job["attempts"]
+        ))
+        conn.commit()
+        return True
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE jobs
+        SET status = 'done', result = %s, result_mimetype = %s, result_filename = %s, finished_at = now()
+        WHERE id = %s AND status = 'running' AND attempts = %s
+    """, (psycopg2.Binary(result), mimetype, filename, job["id"], job["attempts"]))
+    conn.commit()
+    return True
+
+
+class JobWorker(threading.Thread):
+    def __init__(self, app, poll_interval):
+        super().__init__(daemon=True, name="job-worker")
+        self.app = app
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                with self.app.app_context():
+                    ran = run_next_job()
+            except Exception:
+                self.app.logger.exception("Job worker error")
+                ran = False
+
+            if not ran:
+                self.stopping.wait(self.poll_interval)
+
+
+_job_workers = []
+_job_workers_lock = threading.Lock()
+
+def start_job_workers(count=None):
+    """Start in-process workers once per process (JOB_INLINE_WORKERS=0 leaves it to run-jobs)."""
+    count = JOB_INLINE_WORKERS if count is None else count
+
+    with _job_workers_lock:
+        if _job_workers or count <= 0:
+            return
+        for _ in range(count):
+            worker = JobWorker(current_app._get_current_object(), JOB_POLL_INTERVAL)
+            worker.start()
+            _job_workers.append(worker)
+
+
+def job_status(job):
+    status = {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "error": job["error"],
+        "status_url": f"/jobs/{job['id']}",
+    }
+    if job["status"] == "done":
+        status["result_url"] = f"/jobs/{job['id']}/result"
+    return status
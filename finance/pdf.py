@@ -0,0 +1,48 @@
+# PDF report layout. services.build_expenses_pdf imports this module only
+# when a report is built, so reportlab stays out of workers that never export
+# a PDF.
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib import colors
+
+
+# Fixed widths spare reportlab from measuring every cell; they fill A4 inside the default margins
+PDF_COLUMN_WIDTHS = [190, 75, 110, 75]
+PDF_TITLE_MAX_CHARS = 40
+
+PDF_TABLE_STYLE = TableStyle([
+    ("BACKGROUND", (0,0), (-1,0), colors.lightgrey),
+    ("GRID", (0,0), (-1,-1), 1, colors.black),
+    ("ALIGN", (1,1), (-1,-1), "CENTER"),
+])
+
+def pdf_table(data):
+    # repeatRows keeps the header on every page the table splits across
+    table = Table(data, colWidths=PDF_COLUMN_WIDTHS, repeatRows=1)
+    table.setStyle(PDF_TABLE_STYLE)
+    return table
+
+def write_expenses_pdf(output, rows, rows_per_table):
+    """Lay out (title, amount, category, date) rows as the expenses report into output."""
+    styles = getSampleStyleSheet()
+    elements = [Paragraph("Expenses Report", styles["Title"])]
+
+    header = ["Title", "Amount", "Category", "Date"]
+    data = [header]
+
+    # Many bounded tables lay out far faster than one table holding every row
+    for title, amount, category, date in rows:
+        title = title or ""
+        if len(title) > PDF_TITLE_MAX_CHARS:
+            title = title[:PDF_TITLE_MAX_CHARS - 1] + "…"
+
+        data.append([title, str(amount), category, str(date)])
+        if len(data) > rows_per_table:
+            elements.append(pdf_table(data))
+            data = [header]
+
+    if len(data) > 1 or len(elements) == 1:
+        elements.append(pdf_table(data))
+
+    SimpleDocTemplate(output, pagesize=A4).build(elements)
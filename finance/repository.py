@@ -0,0 +1,863 @@
+import os
+import uuid
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from finance.cache import metrics_cache
+from finance.db import get_db_connection, ROLLUP_SELECT_SQL, ROLLUP_BACKFILL_SQL
+from finance.importers import RowStream, IMPORT_MAX_ERRORS
+from finance.instrumentation import TimedCursor
+
+# Every SQL statement the routes and services run lives in this module, and
+# each aggregate is written once: composite reads (the dashboard snapshot,
+# cached user totals) embed the same fragments as scalar subqueries.
+
+# ------------------ DATA VERSION ------------------
+
+def bump_data_version(cursor, user_id):
+    # Called inside the write's transaction so caches never see a half-applied change
+    cursor.execute("""
+        INSERT INTO data_version (user_id, version) VALUES (%s, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = data_version.version + 1, updated_at = now()
+    """, (user_id,))
+    metrics_cache.invalidate(user_id)
+
+def bump_data_versions(cursor, user_ids):
+    """bump_data_version for many users in one statement, locking rows in user order."""
+    user_ids = sorted(user_ids)
+    cursor.execute("""
+        INSERT INTO data_version (user_id, version)
+        SELECT user_id, 1 FROM unnest(%s::int[]) AS u(user_id) ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET version = data_version.version + 1, updated_at = now()
+    """, (user_ids,))
+    for user_id in user_ids:
+        metrics_cache.invalidate(user_id)
+
+def get_data_version(user_id):
+    cursor = get_db_connection().cursor()
+    cursor.execute("SELECT version FROM data_version WHERE user_id = %s", (user_id,))
+    row = cursor.fetchone()
+    return row["version"] if row else 0
+
+def get_data_stamp(user_id):
+    """The user's data version and when it last moved; (0, None) before their first write."""
+    cursor = get_db_connection().cursor()
+    cursor.execute("SELECT version, updated_at FROM data_version WHERE user_id = %s", (user_id,))
+    row = cursor.fetchone()
+    return (row["version"], row["updated_at"]) if row else (0, None)
+
+def get_data_versions():
+    cursor = get_db_connection().cursor()
+    cursor.execute("SELECT user_id, version FROM data_version")
+    return {row["user_id"]: row["version"] for row in cursor.fetchall()}
+
+# ------------------ ROLLUP ------------------
+
+# monthly_rollup holds one (user, kind, month, category) row with the sum and
+# count of its transactions. Every write applies its delta in the same
+# transaction, so monthly reads never touch the raw income/expenses tables.
+ROLLUP_TABLES = {"income": "income", "expense": "expenses"}
+
+def apply_rollup_delta(cursor, user_id, kind, date, category, amount, count):
+    if not date or amount is None:
+        return
+
+    cursor.execute("""
+        INSERT INTO monthly_rollup (user_id, kind, month, category, total, count)
+        VALUES (%s, %s, date_trunc('month', %s::date)::date, COALESCE(%s, ''), %s, %s)
+        ON CONFLICT (user_id, kind, month, category)
+        DO UPDATE SET total = monthly_rollup.total + EXCLUDED.total,
+                      count = monthly_rollup.count + EXCLUDED.count
+    """, (user_id, kind, date, category, float(amount) * count, count))
+
+    if count < 0:
+        cursor.execute("""
+            DELETE FROM monthly_rollup
+            WHERE user_id = %s AND kind = %s AND month = date_trunc('month', %s::date)::date
+              AND category = COALESCE(%s, '') AND count <= 0
+        """, (user_id, kind, date, category))
+
+def rebuild_rollup(user_id=None):
+    """Recompute monthly_rollup from raw rows, for one user or everyone."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    user_filter = "AND user_id = %(user_id)s" if user_id is not None else ""
+    cursor.execute(f"DELETE FROM monthly_rollup WHERE TRUE {user_filter}", {"user_id": user_id})
+    for kind, table in ROLLUP_TABLES.items():
+        cursor.execute(
+            ROLLUP_BACKFILL_SQL.format(table=table, kind=kind, user_filter=user_filter),
+            {"user_id": user_id}
+        )
+
+    conn.commit()
+
+def verify_rollup(user_id=None):
+    """Return rollup rows that disagree with the raw transactions."""
+    cursor = get_db_connection().cursor()
+
+    user_filter = "AND user_id = %(user_id)s" if user_id is not None else ""
+    actual = " UNION ALL ".join(
+        ROLLUP_SELECT_SQL.format(table=table, kind=kind, user_filter=user_filter)
+        for kind, table in ROLLUP_TABLES.items()
+    )
+    cursor.execute(f"""
+        WITH actual AS ({actual}),
+        stored AS (SELECT * FROM monthly_rollup WHERE TRUE {user_filter})
+        SELECT
+            COALESCE(a.user_id, s.user_id) AS user_id,
+            COALESCE(a.kind, s.kind) AS kind,
+            COALESCE(a.month, s.month) AS month,
+            COALESCE(a.category, s.category) AS category,
+            a.total AS actual_total, s.total AS stored_total,
+            a.count AS actual_count, s.count AS stored_count
+        FROM actual a
+        FULL OUTER JOIN stored s
+            ON a.user_id = s.user_id AND a.kind = s.kind AND a.month = s.month AND a.category = s.category
+        WHERE a.total IS DISTINCT FROM s.total OR a.count IS DISTINCT FROM s.count
+        ORDER BY 1, 2, 3, 4
+    """, {"user_id": user_id})
+    return cursor.fetchall()
+
+# ------------------ USERS ------------------
+
+def find_user(username, password):
+    cursor = get_db_connection().cursor()
+    cursor.execute("SELECT id, username FROM users WHERE username = %s AND password = %s", (username, password))
+    return cursor.fetchone()
+
+def create_user(username, password):
+    """Insert a user; returns False when the username is taken."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)", (username, password))
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        return False
+
+    return True
+
+def set_password(username, password):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE users SET password = %s WHERE username = %s", (password, username))
+    conn.commit()
+
+def get_username(user_id):
+    cursor = get_db_connection().cursor()
+    cursor.execute("SELECT username FROM users WHERE id = %s", (user_id,))
+    return cursor.fetchone()["username"]
+
+# ------------------ TRANSACTIONS ------------------
+
+TRANSACTIONS_PAGE_SIZE = int(os.environ.get("TRANSACTIONS_PAGE_SIZE", 20))
+
+def paginate_transactions(kind, rows):
+    """Trim a page fetched with one extra row and build the link to the next page."""
+    if len(rows) <= TRANSACTIONS_PAGE_SIZE:
+        return rows, None
+
+    rows = rows[:TRANSACTIONS_PAGE_SIZE]
+    last = rows[-1]
+    next_url = f"/transactions/{kind}?after_date={last['date'] or ''}&after_id={last['id']}"
+    return rows, next_url
+
+def get_transactions_page(user_id, kind, after_date=None, after_id=None):
+    """One page of income or expense rows, newest first, keyed on (date, id)."""
+    params = {"user_id": user_id, "limit": TRANSACTIONS_PAGE_SIZE + 1}
+    keyset = ""
+
+    if after_id is not None:
+        params.update(after_date=after_date, after_id=after_id)
+        if after_date:
+            keyset = "AND (date, id) < (%(after_date)s, %(after_id)s)"
+        else:
+            # Undated rows sort first; finish them, then continue into the dated ones
+            keyset = "AND ((date IS NULL AND id < %(after_id)s) OR date IS NOT NULL)"
+
+    cursor = get_db_connection().cursor()
+    cursor.execute(f"""
+        SELECT * FROM {ROLLUP_TABLES[kind]}
+        WHERE user_id = %(user_id)s {keyset}
+        ORDER BY date DESC, id DESC
+        LIMIT %(limit)s
+    """, params)
+
+    return paginate_transactions(kind, cursor.fetchall())
+
+def count_transactions(user_id):
+    """Income plus expense rows for a user, read from the rollup."""
+    cursor = get_db_connection().cursor()
+    cursor.execute("SELECT COALESCE(SUM(count), 0) AS count FROM monthly_rollup WHERE user_id = %s", (user_id,))
+    return int(cursor.fetchone()["count"])
+
+def get_transaction(user_id, kind, transaction_id):
+    cursor = get_db_connection().cursor()
+    cursor.execute(
+        f"SELECT * FROM {ROLLUP_TABLES[kind]} WHERE id = %s AND user_id = %s",
+        (transaction_id, user_id)
+    )
+    return cursor.fetchone()
+
+def add_transaction(user_id, kind, title, amount, category, date):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        f"INSERT INTO {ROLLUP_TABLES[kind]} (user_id, title, amount, category, date) VALUES (%s, %s, %s, %s, %s)",
+        (user_id, title, amount, category, date)
+    )
+    apply_rollup_delta(cursor, user_id, kind, date, category, amount, 1)
+    bump_data_version(cursor, user_id)
+    if kind == "expense":
+        refresh_budget_alerts(cursor, user_id, budget_scopes(date, category))
+    conn.commit()
+
+def update_transaction(user_id, kind, transaction_id, title, amount, category, date):
+    """Replace a row's values; returns False when it no longer exists."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    table = ROLLUP_TABLES[kind]
+
+    # Lock the row so the rollup delta removes exactly the values being replaced
+    cursor.execute(
+        f"SELECT amount, category, date FROM {table} WHERE id = %s AND user_id = %s FOR UPDATE",
+        (transaction_id, user_id)
+    )
+    old = cursor.fetchone()
+
+    if not old:
+        conn.rollback()
+        return False
+
+    cursor.execute(
+        f"UPDATE {table} SET title = %s, amount = %s, category = %s, date = %s WHERE id = %s AND user_id = %s",
+        (title, amount, category, date, transaction_id, user_id)
+    )
+
+    apply_rollup_delta(cursor, user_id, kind, old["date"], old["category"], old["amount"], -1)
+    apply_rollup_delta(cursor, user_id, kind, date, category, amount, 1)
+    bump_data_version(cursor, user_id)
+    if kind == "expense":
+        refresh_budget_alerts(
+            cursor, user_id, budget_scopes(old["date"], old["category"]) + budget_scopes(date, category)
+        )
+    conn.commit()
+    return True
+
+def delete_transaction(user_id, kind, transaction_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        f"DELETE FROM {ROLLUP_TABLES[kind]} WHERE id = %s AND user_id = %s RETURNING amount, category, date",
+        (transaction_id, user_id)
+    )
+    deleted = cursor.fetchone()
+
+    if deleted:
+        apply_rollup_delta(cursor, user_id, kind, deleted["date"], deleted["category"], deleted["amount"], -1)
+        bump_data_version(cursor, user_id)
+        if kind == "expense":
+            refresh_budget_alerts(cursor, user_id, budget_scopes(deleted["date"], deleted["category"]))
+    conn.commit()
+
+def import_transactions(user_id, parsed):
+    """COPY parsed rows into a staging table and fan them out in one transaction.
+
+    parsed yields (line, row_or_error). Returns (counts, errors); nothing is
+    kept when any row fails validation.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    errors = []
+
+    def valid_rows():
+        skipped = 0
+        for line, row in parsed:
+            if isinstance(row, Exception):
+                # line is None for problems with the file as a whole
+                message = str(row) if line is None else f"Line {line}: {row}"
+                if len(errors) < IMPORT_MAX_ERRORS or line is None:
+                    errors.append(message)
+                else:
+                    skipped += 1
+                continue
+            yield row
+
+        if skipped:
+            errors.append(f"… and {skipped} more")
+
+    cursor.execute("""
+        CREATE TEMP TABLE import_staging (
+            kind TEXT NOT NULL,
+            title TEXT,
+            amount NUMERIC(12, 2) NOT NULL,
+            category TEXT,
+            date DATE NOT NULL
+        ) ON COMMIT DROP
+    """)
+    try:
+        cursor.copy_expert(
+            "COPY import_staging (kind, title, amount, category, date) FROM STDIN WITH (FORMAT csv)",
+            RowStream(valid_rows())
+        )
+    except psycopg2.DataError as e:
+        # A value the parsers accepted but PostgreSQL did not; COPY can't say which file line
+        conn.rollback()
+        return None, errors + [f"The file could not be imported: {str(e).splitlines()[0]}"]
+
+    if errors:
+        conn.rollback()
+        return None, errors
+
+    for kind, table in ROLLUP_TABLES.items():
+        cursor.execute(f"""
+            INSERT INTO {table} (user_id, title, amount, category, date)
+            SELECT %s, title, amount, category, date FROM import_staging WHERE kind = %s
+        """, (user_id, kind))
+
+    # Derived aggregates are updated once for the whole file
+    cursor.execute("""
+        INSERT INTO monthly_rollup (user_id, kind, month, category, total, count)
+        SELECT %s, kind, date_trunc('month', date)::date, COALESCE(category, ''), SUM(amount), COUNT(*)
+        FROM import_staging
+        GROUP BY kind, 3, 4
+        ON CONFLICT (user_id, kind, month, category)
+        DO UPDATE SET total = monthly_rollup.total + EXCLUDED.total,
+                      count = monthly_rollup.count + EXCLUDED.count
+    """, (user_id,))
+
+    cursor.execute("SELECT kind, COUNT(*) AS count FROM import_staging GROUP BY kind")
+    counts = {"income": 0, "expense": 0}
+    counts.update({row["kind"]: row["count"] for row in cursor.fetchall()})
+
+    bump_data_version(cursor, user_id)
+
+    cursor.execute("""
+        SELECT DISTINCT date_trunc('month', date)::date AS month, COALESCE(category, '') AS category
+        FROM import_staging WHERE kind = 'expense'
+    """)
+    scopes = []
+    for row in cursor.fetchall():
+        scopes.extend(budget_scopes(row["month"], row["category"]))
+    refresh_budget_alerts(cursor, user_id, scopes)
+
+    conn.commit()
+
+    return counts, []
+
+# ------------------ BUDGET ------------------
+
+# A budget row covers one month; recurring_budgets apply to every month
+# without a row of its own. Category '' is the whole month's budget. Spend
+# comes from monthly_rollup, which every expense write already keeps current.
+BUDGET_ALERT_THRESHOLDS = [
+    int(value) for value in os.environ.get("BUDGET_ALERT_THRESHOLDS", "80,100").split(",") if value.strip()
+]
+
+def save_budget(user_id, month, amount, category=""):
+    """Set the budget for month (YYYY-MM) and category in one atomic upsert."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        INSERT INTO budget (user_id, month, category, amount) VALUES (%s, %s, %s, %s)
+        ON CONFLICT (user_id, month, category) DO UPDATE SET amount = EXCLUDED.amount
+    """, (user_id, month, category, amount))
+
+    bump_data_version(cursor, user_id)
+    refresh_budget_alerts(cursor, user_id, [(f"{month}-01", category)])
+    conn.commit()
+
+def save_recurring_budget(user_id, amount, category=""):
+    """Set the budget used for every month that has none of its own."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        INSERT INTO recurring_budgets (user_id, category, amount) VALUES (%s, %s, %s)
+        ON CONFLICT (user_id, category) DO UPDATE SET amount = EXCLUDED.amount
+    """, (user_id, category, amount))
+
+    bump_data_version(cursor, user_id)
+    # Earlier months keep the alerts they had; only the running month is re-evaluated
+    cursor.execute("SELECT current_date AS today")
+    refresh_budget_alerts(cursor, user_id, [(cursor.fetchone()["today"], category)])
+    conn.commit()
+
+def budget_scopes(date, category):
+    """The budgets an expense on date counts against: its month overall, and its category."""
+    if not date:
+        return []
+    scopes = [(date, "")]
+    if category:
+        scopes.append((date, category))
+    return scopes
+
+def refresh_budget_alerts(cursor, user_id, scopes):
+    """Re-evaluate threshold alerts for the given (date, category) scopes only.
+
+    Runs inside the write's transaction, after bump_data_version: that row lock
+    serialises a user's writes, so each refresh sees every earlier write's spend.
+    Alerts no longer reached are cleared, so crossing again alerts again.
+    """
+    if not scopes:
+        return
+
+    cursor.execute("""
+        WITH scopes AS (
+            SELECT DISTINCT date_trunc('month', s.day)::date AS month, s.category
+            FROM unnest(%(days)s::date[], %(categories)s::text[]) AS s(day, category)
+        ),
+        spend AS (
+            SELECT s.month, s.category, COALESCE(b.amount, r.amount) AS budget,
+                (SELECT COALESCE(SUM(m.total), 0) FROM monthly_rollup m
+                 WHERE m.user_id = %(user_id)s AND m.kind = 'expense' AND m.month = s.month
+                   AND (s.category = '' OR m.category = s.category)) AS spent
+            FROM scopes s
+            LEFT JOIN budget b
+                ON b.user_id = %(user_id)s AND b.month = to_char(s.month, 'YYYY-MM') AND b.category = s.category
+            LEFT JOIN recurring_budgets r ON r.user_id = %(user_id)s AND r.category = s.category
+        ),
+        crossed AS (
+            SELECT s.month, s.category, t.threshold, s.spent, s.budget
+            FROM spend s, unnest(%(thresholds)s::int[]) AS t(threshold)
+            WHERE s.budget > 0 AND s.spent >= s.budget * t.threshold / 100.0
+        ),
+        cleared AS (
+            DELETE FROM budget_alerts a
+            USING scopes s
+            WHERE a.user_id = %(user_id)s AND a.month = s.month AND a.category = s.category
+              AND NOT EXISTS (
+                  SELECT 1 FROM crossed c
+                  WHERE c.month = a.month AND c.category = a.category AND c.threshold = a.threshold
+              )
+        )
+        INSERT INTO budget_alerts (user_id, month, category, threshold, spent, budget)
+        SELECT %(user_id)s, month, category, threshold, spent, budget FROM crossed
+        ON CONFLICT (user_id, month, category, threshold) DO NOTHING
+    """, {
+        "user_id": user_id,
+        "days": [day for day, _ in scopes],
+        "categories": [category for _, category in scopes],
+        "thresholds": BUDGET_ALERT_THRESHOLDS,
+    })
+
+# Effective budgets for %(month)s (YYYY-MM) with their spend and highest alert
+BUDGET_STATUS_SQL = """
+    WITH budgets AS (
+        SELECT category, amount, false AS recurring FROM budget
+        WHERE user_id = %(user_id)s AND month = %(month)s
+        UNION ALL
+        SELECT r.category, r.amount, true FROM recurring_budgets r
+        WHERE r.user_id = %(user_id)s AND NOT EXISTS (
+            SELECT 1 FROM budget b WHERE b.user_id = r.user_id AND b.month = %(month)s AND b.category = r.category
+        )
+    ),
+    spend AS (
+        SELECT category, total FROM monthly_rollup
+        WHERE user_id = %(user_id)s AND kind = 'expense' AND month = to_date(%(month)s, 'YYYY-MM')
+    )
+    SELECT
+        b.category,
+        b.amount AS budget,
+        b.recurring,
+        CASE WHEN b.category = '' THEN (SELECT COALESCE(SUM(total), 0) FROM spend)
+             ELSE COALESCE((SELECT total FROM spend s WHERE s.category = b.category), 0)
+        END AS spent,
+        (SELECT MAX(threshold) FROM budget_alerts a
+         WHERE a.user_id = %(user_id)s AND a.month = to_date(%(month)s, 'YYYY-MM') AND a.category = b.category
+        ) AS alert_threshold
+    FROM budgets b
+    WHERE b.amount > 0
+"""
+
+def get_budget_status(user_id, month):
+    cursor = get_db_connection().cursor()
+    cursor.execute(BUDGET_STATUS_SQL + " ORDER BY b.category", {"user_id": user_id, "month": month})
+    return cursor.fetchall()
+
+# ------------------ RECURRING ------------------
+
+# A rule's k-th occurrence is start_date plus k steps, always counted from the
+# start so a monthly rule on the 31st lands on each month's last day. Every
+# materialized occurrence is recorded in recurring_occurrences, so a batch
+# that is rerun (or overlaps another scheduler) inserts nothing twice.
+RECURRING_FREQUENCIES = ("monthly", "weekly", "custom")
+RECURRING_BATCH_RULES = int(os.environ.get("RECURRING_BATCH_RULES", 500))
+RECURRING_MAX_CATCHUP = int(os.environ.get("RECURRING_MAX_CATCHUP", 366))
+
+def occurrence_sql(index, rule="r"):
+    """SQL for the date of a rule's index-th occurrence ("custom" steps in days)."""
+    return f"""({rule}.start_date + CASE {rule}.frequency
+        WHEN 'monthly' THEN make_interval(months => {index} * {rule}.repeat_every)
+        WHEN 'weekly' THEN make_interval(weeks => {index} * {rule}.repeat_every)
+        ELSE make_interval(days => {index} * {rule}.repeat_every)
+    END)::date"""
+
+def create_recurring_rule(user_id, kind, title, amount, category, frequency, repeat_every, start_date, end_date):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO recurring_rules
+            (user_id, kind, title, amount, category, frequency, repeat_every, start_date, end_date, next_date)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING id
+    """, (user_id, kind, title, amount, category, frequency, repeat_every, start_date, end_date, start_date))
+    rule_id = cursor.fetchone()["id"]
+    conn.commit()
+    return rule_id
+
+def get_recurring_rules(user_id):
+    cursor = get_db_connection().cursor()
+    cursor.execute("""
+        SELECT id, kind, title, amount, category, frequency, repeat_every, start_date, end_date, next_date, active
+        FROM recurring_rules WHERE user_id = %s
+        ORDER BY active DESC, next_date, id
+    """, (user_id,))
+    return cursor.fetchall()
+
+def stop_recurring_rule(user_id, rule_id):
+    """Stop future occurrences; the ones already materialized stay."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE recurring_rules SET active = false WHERE id = %s AND user_id = %s", (rule_id, user_id))
+    conn.commit()
+
+def materialize_recurring_batch(today, after_id=0, user_id=None):
+    """Insert the due occurrences of the next RECURRING_BATCH_RULES due rules after after_id.
+
+    One transaction: occurrences are claimed in the ledger, inserted with one
+    multi-row INSERT per table, and folded into the rollup, data versions and
+    budget alerts. Returns (last rule id or None when nothing was due,
+    {user_id: transactions inserted}).
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    # Rules another scheduler has claimed are skipped, not waited on
+    cursor.execute(f"""
+        CREATE TEMP TABLE recurring_staging ON COMMIT DROP AS
+        WITH rules AS (
+            SELECT * FROM recurring_rules
+            WHERE active AND next_date <= %(today)s AND id > %(after_id)s
+              AND (end_date IS NULL OR next_date <= end_date)
+              AND (%(user_id)s IS NULL OR user_id = %(user_id)s)
+            ORDER BY id
+            LIMIT %(limit)s
+            FOR UPDATE SKIP LOCKED
+        )
+        SELECT r.id AS rule_id, r.user_id, r.kind, r.title, r.amount, r.category, k, {occurrence_sql("k")} AS period
+        FROM rules r
+        CROSS JOIN LATERAL generate_series(r.next_index, r.next_index + %(catchup)s - 1) AS k
+        WHERE {occurrence_sql("k")} <= LEAST(%(today)s, COALESCE(r.end_date, %(today)s))
+    """, {
+        "today": today,
+        "after_id": after_id,
+        "user_id": user_id,
+        "limit": RECURRING_BATCH_RULES,
+        "catchup": RECURRING_MAX_CATCHUP,
+    })
+
+    cursor.execute("SELECT MAX(rule_id) AS last_id FROM recurring_staging")
+    last_id = cursor.fetchone()["last_id"]
+    if last_id is None:
+        conn.commit()
+        return None, {}
+
+    # Move each rule past what was staged; a rule that reached its end_date stops
+    cursor.execute(f"""
+        UPDATE recurring_rules r
+        SET next_index = s.next_index,
+            next_date = {occurrence_sql("s.next_index")},
+            active = r.end_date IS NULL OR {occurrence_sql("s.next_index")} <= r.end_date
+        FROM (SELECT rule_id, MAX(k) + 1 AS next_index FROM recurring_staging GROUP BY rule_id) s
+        WHERE r.id = s.rule_id
+    """)
+
+    # Keep only occurrences this batch is the first to claim
+    cursor.execute("""
+        WITH claimed AS (
+            INSERT INTO recurring_occurrences (rule_id, period)
+            SELECT rule_id, period FROM recurring_staging ORDER BY rule_id, period
+            ON CONFLICT (rule_id, period) DO NOTHING
+            RETURNING rule_id, period
+        )
+        DELETE FROM recurring_staging s
+        WHERE NOT EXISTS (SELECT 1 FROM claimed c WHERE c.rule_id = s.rule_id AND c.period = s.period)
+    """)
+
+    for kind, table in ROLLUP_TABLES.items():
+        cursor.execute(f"""
+            INSERT INTO {table} (user_id, title, amount, category, date)
+            SELECT user_id, title, amount, category, period FROM recurring_staging
+            WHERE kind = %s
+            ORDER BY user_id, period
+        """, (kind,))
+
+    cursor.execute("""
+        INSERT INTO monthly_rollup (user_id, kind, month, category, total, count)
+        SELECT user_id, kind, date_trunc('month', period)::date, COALESCE(category, ''), SUM(amount), COUNT(*)
+        FROM recurring_staging
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (user_id, kind, month, category)
+        DO UPDATE SET total = monthly_rollup.total + EXCLUDED.total,
+                      count = monthly_rollup.count + EXCLUDED.count
+    """)
+
+    cursor.execute("SELECT user_id, COUNT(*) AS count FROM recurring_staging GROUP BY user_id")
+    counts = {row["user_id"]: row["count"] for row in cursor.fetchall()}
+
+    if counts:
+        bump_data_versions(cursor, counts)
+
+        cursor.execute("""
+            SELECT DISTINCT user_id, date_trunc('month', period)::date AS month, category
+            FROM recurring_staging WHERE kind = 'expense'
+        """)
+        scopes = {}
+        for row in cursor.fetchall():
+            scopes.setdefault(row["user_id"], []).extend(budget_scopes(row["month"], row["category"]))
+        for scope_user_id, user_scopes in scopes.items():
+            refresh_budget_alerts(cursor, scope_user_id, user_scopes)
+
+    conn.commit()
+    return last_id, counts
+
+# ------------------ AGGREGATES ------------------
+
+# Aggregates are read from monthly_rollup, so cost grows with months, not transactions
+MONTHLY_EXPENSE_TOTALS_SQL = """
+    SELECT to_char(month, 'YYYY-MM') AS month, SUM(total) AS total
+    FROM monthly_rollup
+    WHERE user_id = %(user_id)s AND kind = 'expense'
+    GROUP BY 1
+    ORDER BY 1
+"""
+
+CATEGORY_EXPENSE_TOTALS_SQL = """
+    SELECT category, SUM(total) AS total
+    FROM monthly_rollup
+    WHERE user_id = %(user_id)s AND kind = 'expense'
+    GROUP BY category
+    ORDER BY category
+"""
+
+# All-time total for one kind ('income' or 'expense')
+KIND_TOTAL_SQL = "SELECT SUM(total) FROM monthly_rollup WHERE user_id = %(user_id)s AND kind = '{kind}'"
+
+# The whole-month budget: the month's own row, else the recurring one
+MONTHLY_BUDGET_SQL = """
+    SELECT COALESCE(
+        (SELECT amount FROM budget WHERE user_id = %(user_id)s AND month = %(month)s AND category = ''),
+        (SELECT amount FROM recurring_budgets WHERE user_id = %(user_id)s AND category = '')
+    )
+"""
+
+def get_monthly_expense_totals(user_id):
+    cursor = get_db_connection().cursor()
+    cursor.execute(MONTHLY_EXPENSE_TOTALS_SQL, {"user_id": user_id})
+    return cursor.fetchall()
+
+def get_category_expense_totals(user_id):
+    cursor = get_db_connection().cursor()
+    cursor.execute(CATEGORY_EXPENSE_TOTALS_SQL, {"user_id": user_id})
+    return cursor.fetchall()
+
+def get_user_totals(user_id, month):
+    """All-time income and expense totals plus the budget for month (YYYY-MM)."""
+    cursor = get_db_connection().cursor()
+    cursor.execute(f"""
+        SELECT
+            ({KIND_TOTAL_SQL.format(kind="income")}) AS total_income,
+            ({KIND_TOTAL_SQL.format(kind="expense")}) AS total_expense,
+            ({MONTHLY_BUDGET_SQL}) AS monthly_budget
+    """, {"user_id": user_id, "month": month})
+    return cursor.fetchone()
+
+def get_dashboard_rows(user_id, month, page_limit):
+    """Everything the dashboard needs in one round trip, with aggregates computed in SQL."""
+    cursor = get_db_connection().cursor()
+    cursor.execute(f"""
+        SELECT
+            (SELECT COALESCE(json_agg(i ORDER BY i.date DESC, i.id DESC), '[]') FROM (
+                SELECT * FROM income WHERE user_id = %(user_id)s ORDER BY date DESC, id DESC LIMIT %(page_limit)s
+            ) i) AS incomes,
+            (SELECT COALESCE(json_agg(e ORDER BY e.date DESC, e.id DESC), '[]') FROM (
+                SELECT * FROM expenses WHERE user_id = %(user_id)s ORDER BY date DESC, id DESC LIMIT %(page_limit)s
+            ) e) AS expenses,
+            ({KIND_TOTAL_SQL.format(kind="income")}) AS total_income,
+            (SELECT COALESCE(json_agg(m ORDER BY m.month), '[]') FROM ({MONTHLY_EXPENSE_TOTALS_SQL}) m) AS monthly,
+            (SELECT COALESCE(json_agg(c ORDER BY c.category), '[]') FROM ({CATEGORY_EXPENSE_TOTALS_SQL}) c) AS by_category,
+            ({MONTHLY_BUDGET_SQL}) AS monthly_budget,
+            (SELECT version FROM data_version WHERE user_id = %(user_id)s) AS data_version,
+            (SELECT row_to_json(f) FROM forecasts f WHERE f.user_id = %(user_id)s) AS forecast,
+            (SELECT COALESCE(json_agg(bs ORDER BY bs.category), '[]') FROM ({BUDGET_STATUS_SQL}) bs) AS budgets
+    """, {"user_id": user_id, "month": month, "page_limit": page_limit})
+    return cursor.fetchone()
+
+# ------------------ TRENDS ------------------
+
+# One pass over the rollup: a zero-filled month x category grid, summed per
+# category and overall (GROUPING SETS), then rolling/MoM/YoY via windows.
+# Rows before %(start)s only feed the windows and are dropped at the end.
+TREND_SQL = """
+    WITH categories AS (
+        SELECT DISTINCT category FROM monthly_rollup
+        WHERE user_id = %(user_id)s AND kind = %(kind)s AND month BETWEEN %(first)s AND %(last)s
+            AND (%(category)s IS NULL OR category = %(category)s)
+    ),
+    grid AS (
+        SELECT m.month::date AS month, c.category
+        FROM generate_series(%(first)s::date, %(last)s::date, interval '1 month') AS m(month)
+        LEFT JOIN categories c ON true
+    ),
+    totals AS (
+        SELECT g.month, g.category, GROUPING(g.category) AS overall, COALESCE(SUM(r.total), 0) AS total
+        FROM grid g
+        LEFT JOIN monthly_rollup r
+            ON r.user_id = %(user_id)s AND r.kind = %(kind)s AND r.month = g.month AND r.category = g.category
+        GROUP BY GROUPING SETS ((g.month, g.category), (g.month))
+    ),
+    windowed AS (
+        SELECT month, category, overall, total,
+            SUM(total) OVER rolling AS rolling_total,
+            LAG(total) OVER w AS last_month_total,
+            LAG(total, 12) OVER w AS last_year_total
+        FROM totals
+        WHERE overall = 1 OR category IS NOT NULL
+        WINDOW w AS (PARTITION BY overall, category ORDER BY month),
+               rolling AS (w ROWS BETWEEN %(preceding)s PRECEDING AND CURRENT ROW)
+    )
+    SELECT
+        to_char(month, 'YYYY-MM') AS month,
+        CASE WHEN overall = 1 THEN NULL ELSE category END AS category,
+        total,
+        rolling_total,
+        total - last_month_total AS mom_change,
+        round((total - last_month_total) / NULLIF(last_month_total, 0) * 100, 2) AS mom_percent,
+        total - last_year_total AS yoy_change,
+        round((total - last_year_total) / NULLIF(last_year_total, 0) * 100, 2) AS yoy_percent
+    FROM windowed
+    WHERE month >= %(start)s
+    ORDER BY overall DESC, category, month
+"""
+
+def get_trend_rows(user_id, kind, start, end, window, category=None):
+    """Monthly totals from start to end (first-of-month dates), overall rows first (category None)."""
+    # Enough history before start for a full rolling window and a year-ago month
+    first = month_offset(start, -max(12, window - 1))
+    cursor = get_db_connection().cursor()
+    cursor.execute(TREND_SQL, {
+        "user_id": user_id,
+        "kind": kind,
+        "first": first,
+        "start": start,
+        "last": end,
+        "preceding": window - 1,
+        "category": category,
+    })
+    return cursor.fetchall()
+
+def month_offset(month, months):
+    """Shift a first-of-month date by a number of months."""
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+# ------------------ EXPORT ------------------
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 2000))
+
+def export_query(user_id, kind, filters):
+    sql = f"SELECT title, amount, category, date FROM {ROLLUP_TABLES[kind]} WHERE user_id = %(user_id)s"
+    params = dict(filters, user_id=user_id)
+
+    if "from_date" in filters:
+        sql += " AND date >= %(from_date)s"
+    if "to_date" in filters:
+        sql += " AND date <= %(to_date)s"
+    if "category" in filters:
+        sql += " AND category = %(category)s"
+
+    return sql + " ORDER BY date, id", params
+
+def iter_export_rows(user_id, kind, filters):
+    """Yield (title, amount, category, date) tuples, EXPORT_BATCH_SIZE rows per fetch."""
+    sql, params = export_query(user_id, kind, filters)
+
+    # A named cursor keeps the result set in Postgres; rows arrive itersize at a time
+    cursor = get_db_connection().cursor(name=f"export_{kind}_{uuid.uuid4().hex}", cursor_factory=TimedCursor)
+    cursor.itersize = EXPORT_BATCH_SIZE
+    cursor.execute(sql, params)
+
+    try:
+        yield from cursor
+    finally:
+        cursor.close()
+
+# ------------------ FORECASTS ------------------
+
+FORECAST_BATCH_USERS = int(os.environ.get("FORECAST_BATCH_USERS", 5000))
+
+def get_forecast_versions(user_ids=None, after_id=0):
+    """user_id -> data version for the given users, or the next batch of all users after after_id."""
+    cursor = get_db_connection().cursor()
+
+    if user_ids is None:
+        cursor.execute("""
+            SELECT u.id AS user_id, COALESCE(v.version, 0) AS version
+            FROM users u LEFT JOIN data_version v ON v.user_id = u.id
+            WHERE u.id > %s
+            ORDER BY u.id
+            LIMIT %s
+        """, (after_id, FORECAST_BATCH_USERS))
+    else:
+        cursor.execute("""
+            SELECT u.id AS user_id, COALESCE(v.version, 0) AS version
+            FROM unnest(%s::integer[]) AS u(id) LEFT JOIN data_version v ON v.user_id = u.id
+        """, (list(user_ids),))
+
+    return {row["user_id"]: row["version"] for row in cursor.fetchall()}
+
+def get_all_user_ids():
+    cursor = get_db_connection().cursor()
+    cursor.execute("SELECT id FROM users ORDER BY id")
+    return [row["id"] for row in cursor.fetchall()]
+
+def load_monthly_histories(user_ids):
+    cursor = get_db_connection().cursor()
+    cursor.execute("""
+        SELECT user_id, SUM(total) AS total
+        FROM monthly_rollup
+        WHERE kind = 'expense' AND user_id = ANY(%s)
+        GROUP BY user_id, month
+        ORDER BY user_id, month
+    """, (list(user_ids),))
+
+    histories = {user_id: [] for user_id in user_ids}
+    for row in cursor.fetchall():
+        histories[row["user_id"]].append(row["total"])
+    return histories
+
+def store_forecasts(versions, results):
+    conn = get_db_connection()
+    execute_values(conn.cursor(), """
+        INSERT INTO forecasts (user_id, data_version, predicted, note, months)
+        VALUES %s
+        ON CONFLICT (user_id) DO UPDATE
+        SET data_version = EXCLUDED.data_version, predicted = EXCLUDED.predicted,
+            note = EXCLUDED.note, months = EXCLUDED.months, computed_at = now()
+    """, [
+        (user_id, versions[user_id], predicted, note, months)
+        for user_id, (predicted, note, months) in results.items()
+    ])
+    conn.commit()
+
+def get_stored_forecast(user_id):
+    cursor = get_db_connection().cursor()
+    cursor.execute("SELECT predicted, note FROM forecasts WHERE user_id = %s", (user_id,))
+    return cursor.fetchone()
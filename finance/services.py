@@ -0,0 +1,601 @@
+import io
+import os
+import csv
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from datetime import datetime, timedelta
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+from flask import current_app
+
+from finance import repository
+from finance.cache import ChartCache, chart_cache, metrics_cache
+from finance.instrumentation import propagate, span
+
+# Business logic shared by the blueprints. Everything here reads through
+# repository, so a query is cached, batched or measured in one place.
+
+# ------------------ FAN-OUT ------------------
+
+# Independent pieces of one page (chart renders, a forecast refit) run on
+# these threads while the request thread carries on. Each task gets its own
+# app context, but tasks must not query: the request thread keeps its pooled
+# connection while it waits, so a task needing a second one can starve the
+# pool under load. Hand tasks the data they need and write results back on
+# the request thread.
+FAN_OUT_THREADS = int(os.environ.get("FAN_OUT_THREADS", 8))
+fan_out_executor = ThreadPoolExecutor(max_workers=FAN_OUT_THREADS, thread_name_prefix="fan-out")
+
+def submit(fn, *args, **kwargs):
+    """Start fn on the fan-out pool, inside an app context and on this request's trace."""
+    app = current_app._get_current_object()
+    traced = propagate(fn)
+
+    def run():
+        with app.app_context():
+            return traced(*args, **kwargs)
+
+    return fan_out_executor.submit(run)
+
+def completed(value):
+    """A Future that is already done, for pieces that turned out to need no work."""
+    future = Future()
+    future.set_result(value)
+    return future
+
+# ------------------ DASHBOARD ------------------
+
+def totals_by(rows, key):
+    """Map each row's key (month or category) to its total, keeping row order."""
+    return {row[key]: float(row["total"] or 0) for row in rows}
+
+def load_dashboard_snapshot(user_id):
+    current_month = datetime.now().strftime("%Y-%m")
+    row = repository.get_dashboard_rows(user_id, current_month, repository.TRANSACTIONS_PAGE_SIZE + 1)
+
+    incomes, incomes_next = repository.paginate_transactions("income", row["incomes"])
+    expenses, expenses_next = repository.paginate_transactions("expense", row["expenses"])
+
+    monthly = totals_by(row["monthly"], "month")
+    by_category = totals_by(row["by_category"], "category")
+
+    monthly_budget = row["monthly_budget"] or 0
+    total_income = row["total_income"] or 0
+    total_expense = float(sum(monthly.values()))
+    month_expense = float(monthly.get(current_month, 0))
+
+    if monthly_budget == 0:
+        budget_status = "not_set"
+    elif month_expense > monthly_budget:
+        budget_status = "over"
+    else:
+        budget_status = "under"
+
+    return {
+        "data_version": row["data_version"] or 0,
+        "forecast": row["forecast"],
+        "incomes": incomes,
+        "incomes_next": incomes_next,
+        "expenses": expenses,
+        "expenses_next": expenses_next,
+        "total_income": total_income,
+        "total_expense": total_expense,
+        "balance": total_income - total_expense,
+        "monthly_budget": monthly_budget,
+        "month_expense": month_expense,
+        "remaining_budget": monthly_budget - month_expense,
+        "budget_status": budget_status,
+        "monthly": monthly,
+        "by_category": by_category,
+        "budgets": describe_budgets(row["budgets"]),
+    }
+
+def get_month_comparison(user_id, now=None):
+    """This month's spending against last month's, as shown on the summary page."""
+    now = now or datetime.now()
+    this_month = now.strftime("%Y-%m")
+
+    first_day = now.replace(day=1)
+    last_month_date = first_day - timedelta(days=1)
+    last_month = last_month_date.strftime("%Y-%m")
+
+    monthly = totals_by(repository.get_monthly_expense_totals(user_id), "month")
+    this_month_total = monthly.get(this_month, 0)
+    last_month_total = monthly.get(last_month, 0)
+
+    diff = this_month_total - last_month_total
+
+    if last_month_total > 0:
+        percent_change = (diff / last_month_total) * 100
+    else:
+        percent_change = 0
+
+    if diff > 0:
+        message = "📈 Your spending increased compared to last month."
+    elif diff < 0:
+        message = "📉 Good! Your spending decreased."
+    else:
+        message = "➡️ Your spending is the same as last month."
+
+    return {
+        "this_month_total": this_month_total,
+        "last_month_total": last_month_total,
+        "diff": diff,
+        "percent_change": percent_change,
+        "message": message,
+        "this_month": this_month,
+        "last_month": last_month,
+    }
+
+# ------------------ BUDGETS ------------------
+
+def describe_budgets(rows):
+    """Add remaining, percent used and a status to budget status rows."""
+    budgets = []
+    for row in rows:
+        budget = float(row["budget"])
+        spent = float(row["spent"])
+
+        if spent > budget:
+            status = "over"
+        elif row["alert_threshold"]:
+            status = "warning"
+        else:
+            status = "under"
+
+        budgets.append(dict(
+            row, budget=budget, spent=spent, remaining=budget - spent,
+            percent=round(spent / budget * 100, 1), status=status,
+        ))
+    return budgets
+
+def get_budget_status(user_id, month):
+    return describe_budgets(repository.get_budget_status(user_id, month))
+
+# ------------------ METRICS ------------------
+
+def build_user_metrics(totals, data_version, month):
+    total_income = totals["total_income"] or 0
+    total_expense = totals["total_expense"] or 0
+    monthly_budget = totals["monthly_budget"] or 0
+    health_score, health_message = score_financial_health(total_income, total_expense, monthly_budget)
+
+    return {
+        "data_version": data_version,
+        "month": month,
+        "total_income": total_income,
+        "total_expense": total_expense,
+        "balance": total_income - total_expense,
+        "monthly_budget": monthly_budget,
+        "health_score": health_score,
+        "health_message": health_message,
+    }
+
+def get_user_metrics(user_id):
+    """Cached totals and health score; a hit costs one data-version lookup."""
+    current_month = datetime.now().strftime("%Y-%m")
+    version = repository.get_data_version(user_id)
+
+    metrics = metrics_cache.get(user_id)
+    if metrics and metrics["data_version"] == version and metrics["month"] == current_month:
+        return metrics
+
+    metrics = build_user_metrics(repository.get_user_totals(user_id, current_month), version, current_month)
+    metrics_cache.set(user_id, metrics)
+    return metrics
+
+def calculate_financial_health_score(user_id, totals=None):
+    # The dashboard passes its snapshot so the totals are not queried twice
+    if totals is None:
+        metrics = get_user_metrics(user_id)
+        return metrics["health_score"], metrics["health_message"]
+
+    return score_financial_health(
+        totals["total_income"] or 0, totals["total_expense"] or 0, totals["monthly_budget"] or 0
+    )
+
+def score_financial_health(total_income, total_expense, monthly_budget):
+    # If no income, cannot calculate
+    if total_income == 0:
+        return 0, "No income data yet."
+
+    savings = total_income - total_expense
+    savings_ratio = savings / total_income
+
+    # Base score
+    score = savings_ratio * 100
+
+    # Budget penalty
+    if monthly_budget > 0 and total_expense > monthly_budget:
+        over = (total_expense - monthly_budget) / monthly_budget
+        score -= over * 30
+
+    # Clamp score
+    if score < 0:
+        score = 0
+    if score > 100:
+        score = 100
+
+    # Message
+    if score >= 80:
+        msg = "Excellent! Your financial health is very good."
+    elif score >= 60:
+        msg = "Good. You are managing your finances well."
+    elif score >= 40:
+        msg = "Average. Try to save more."
+    else:
+        msg = "Poor. You should control your expenses."
+
+    return int(score), msg
+
+# ------------------ TRENDS ------------------
+
+TRENDS_MAX_MONTHS = int(os.environ.get("TRENDS_MAX_MONTHS", 120))
+
+def parse_trend_args(args, now=None):
+    """Read kind/months/window/end/category query args; raises ValueError when one is invalid."""
+    kind = args.get("kind", "expense")
+    if kind not in repository.ROLLUP_TABLES:
+        raise ValueError("kind must be income or expense")
+
+    try:
+        months = int(args.get("months", 12))
+        window = int(args.get("window", 3))
+    except ValueError:
+        raise ValueError("months and window must be whole numbers")
+
+    if not 1 <= months <= TRENDS_MAX_MONTHS:
+        raise ValueError(f"months must be between 1 and {TRENDS_MAX_MONTHS}")
+    if not 1 <= window <= months:
+        raise ValueError("window must be between 1 and months")
+
+    if args.get("end"):
+        try:
+            end = datetime.strptime(args["end"], "%Y-%m").date()
+        except ValueError:
+            raise ValueError("end must be YYYY-MM")
+    else:
+        end = (now or datetime.now()).date().replace(day=1)
+
+    return {
+        "kind": kind,
+        "months": months,
+        "window": window,
+        "end": end,
+        "category": args.get("category") or None,
+    }
+
+def get_trends(user_id, kind, months, window, end, category=None):
+    """Rolling, month-over-month and year-over-year figures for the months up to end."""
+    start = repository.month_offset(end, -(months - 1))
+    rows = repository.get_trend_rows(user_id, kind, start, end, window, category)
+
+    series = []
+    categories = {}
+    for row in rows:
+        point = {key: value for key, value in row.items() if key != "category"}
+        if row["category"] is None:
+            series.append(point)
+        else:
+            categories.setdefault(row["category"], []).append(point)
+
+    return {
+        "kind": kind,
+        "start": start.strftime("%Y-%m"),
+        "end": end.strftime("%Y-%m"),
+        "months": months,
+        "window": window,
+        "series": series,
+        "categories": categories,
+    }
+
+# ------------------ PAGE CACHING ------------------
+
+# /dashboard, /summary and /profile are pure functions of the user's data
+# version, the current month, the templates and the deployed code, so those
+# make up their ETag.
+PAGE_CACHING = os.environ.get("PAGE_CACHING", "1") == "1"
+PAGE_CACHE_CONTROL = os.environ.get("PAGE_CACHE_CONTROL", "private, no-cache")
+
+# A (re)started process may be serving new templates, code or config, so its
+# pages count as modified from then on. Deploys can set BUILD_ID (e.g. the git
+# commit) so every worker and host agree on ETags; without it each process
+# start is a new build.
+PROCESS_STARTED = datetime.now().astimezone()
+BUILD_ID = os.environ.get("BUILD_ID") or PROCESS_STARTED.isoformat()
+
+@lru_cache(maxsize=1)
+def template_stamp():
+    """Digest of the template files' contents as they were when first called.
+
+    Computed once per process, so template edits take effect on the next
+    restart or deploy, which is also when they start being served. Contents,
+    not mtimes, so hosts with separate checkouts agree.
+    """
+    directory = current_app.template_folder
+    digest = hashlib.sha1()
+    for root, dirs, names in os.walk(directory):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, directory).encode() + b"\0")
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha1(f.read()).digest())
+    return digest.hexdigest()[:12]
+
+def page_validators(endpoint, user_id, stamp, now=None):
+    """(etag, last_modified) for a versioned page given get_data_stamp's result."""
+    version, updated_at = stamp
+    now = (now or datetime.now()).astimezone()
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    etag = hashlib.sha1(
+        f"{endpoint}:{user_id}:{version}:{month_start:%Y-%m}:{template_stamp()}:{BUILD_ID}".encode()
+    ).hexdigest()[:20]
+
+    # Pages also roll over with the month and with each deploy or restart
+    last_modified = max(updated_at or month_start, month_start, PROCESS_STARTED)
+    return etag, last_modified
+
+# ------------------ CHARTS ------------------
+
+# "server" renders PNGs with matplotlib, "client" leaves drawing to the browser
+CHART_MODE = os.environ.get("CHART_MODE", "server")
+CHART_CACHE_CONTROL = os.environ.get("CHART_CACHE_CONTROL", "private, max-age=31536000, immutable")
+
+# Client mode draws with a pinned Chart.js served from static/, never a CDN.
+# To vendor it (check the checksum against the npm package before committing):
+#   curl -o static/vendor/chart.js-4.4.1.umd.min.js \
+#       https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js
+CHARTJS_VERSION = "4.4.1"
+CHARTJS_ASSET = f"vendor/chart.js-{CHARTJS_VERSION}.umd.min.js"
+
+def check_chart_assets(app):
+    """Refuse to start in client mode without the vendored Chart.js, rather than serve blank charts."""
+    if CHART_MODE == "client" and not os.path.exists(os.path.join(app.static_folder, CHARTJS_ASSET)):
+        raise RuntimeError(
+            f"CHART_MODE=client needs static/{CHARTJS_ASSET}; vendor it (see finance/services.py) "
+            "or set CHART_MODE=server"
+        )
+
+# matplotlib holds the GIL while drawing, so renders on the fan-out threads
+# still take turns. With CHART_RENDER_PROCESSES > 0 they are drawn in
+# subprocesses instead: both dashboard charts render at once and the
+# worker's own threads stay free for other requests. See finance/charts.py.
+CHART_RENDER_PROCESSES = int(os.environ.get("CHART_RENDER_PROCESSES", 0))
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+def get_render_pool():
+    global _render_pool
+    if _render_pool is None:
+        with _render_pool_lock:
+            if _render_pool is None:
+                # spawn, not fork: the parent has threads and open database sockets
+                _render_pool = ProcessPoolExecutor(
+                    max_workers=CHART_RENDER_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+                )
+    return _render_pool
+
+def render_chart(kind, series):
+    from finance import charts
+
+    if CHART_RENDER_PROCESSES <= 0:
+        return charts.render(kind, series)
+    return get_render_pool().submit(charts.render, kind, series).result()
+
+def get_chart(user_id, kind, version, series=None):
+    """Return (digest, png) for this data version, rendering it only on a miss."""
+    key = (user_id, kind, version)
+    entry = chart_cache.get(key)
+    if entry is not None:
+        return entry
+
+    if series is None:
+        if kind == "monthly":
+            series = totals_by(repository.get_monthly_expense_totals(user_id), "month")
+        else:
+            series = totals_by(repository.get_category_expense_totals(user_id), "category")
+
+    if not series:
+        return None
+
+    with span("chart", kind):
+        png = render_chart(kind, series)
+
+    return chart_cache.put(key, png), png
+
+def chart_url(user_id, kind, version, digest):
+    return f"/charts/{user_id}/{ChartCache.filename(kind, version, digest)}"
+
+def generate_monthly_expense_chart(user_id, monthly=None, version=None):
+    if version is None:
+        version = repository.get_data_version(user_id)
+
+    entry = get_chart(user_id, "monthly", version, monthly)
+    if entry is None:
+        return None
+
+    return chart_url(user_id, "monthly", version, entry[0])
+
+def generate_category_pie_chart(user_id, by_category=None, version=None):
+    if version is None:
+        version = repository.get_data_version(user_id)
+
+    entry = get_chart(user_id, "category", version, by_category)
+    if entry is None:
+        return None
+
+    return chart_url(user_id, "category", version, entry[0])
+
+# ------------------ FORECASTS ------------------
+
+# Forecasts are fitted for many users at once by forecasting.forecast_batch
+# and stored in the forecasts table. predict_next_month_expense stays as the
+# sklearn reference the batch engine is benchmarked against.
+
+def predict_next_month_expense(user_id, monthly=None):
+    if monthly is None:
+        monthly = totals_by(repository.get_monthly_expense_totals(user_id), "month")
+
+    with span("forecast", "sklearn"):
+        from finance import forecasting
+        return forecasting.predict_next_month(list(monthly.values()))
+
+def forecast_batch(histories):
+    with span("forecast", "batch"):
+        from finance import forecasting
+        return forecasting.forecast_batch(histories)
+
+def refresh_forecasts(user_ids=None):
+    """Recompute and store forecasts for the given users, or every user in batches."""
+    last_id = 0
+    refreshed = 0
+    while True:
+        # Versions are read before the totals, so a racing write leaves the row stale, not wrong
+        versions = repository.get_forecast_versions(user_ids, after_id=last_id)
+        if not versions:
+            break
+
+        results = forecast_batch(repository.load_monthly_histories(versions))
+        repository.store_forecasts(versions, results)
+
+        refreshed += len(results)
+        if user_ids is not None:
+            break
+        last_id = max(versions)
+
+    return refreshed
+
+def submit_dashboard_forecast(user_id, snapshot):
+    """Refit this user on the pool unless the stored forecast matches the data version.
+
+    Returns a Future of forecast_batch's results, or of None when the stored row is current.
+    The task only fits; finish_dashboard_forecast stores the result.
+    """
+    stored = snapshot["forecast"]
+    if stored and stored["data_version"] == snapshot["data_version"]:
+        return completed(None)
+
+    return submit(forecast_batch, {user_id: list(snapshot["monthly"].values())})
+
+def finish_dashboard_forecast(user_id, snapshot, forecast):
+    """Wait for submit_dashboard_forecast's Future and return (predicted, note).
+
+    The refit is stored here, on the request's own connection: a fan-out task
+    that checked out a second one while this thread waits could exhaust the pool.
+    """
+    results = forecast.result()
+    if results is None:
+        stored = snapshot["forecast"]
+        return stored["predicted"], stored["note"]
+
+    repository.store_forecasts({user_id: snapshot["data_version"]}, results)
+
+    predicted, note, _ = results[user_id]
+    return predicted, note
+
+# ------------------ RECURRING ------------------
+
+def materialize_recurring(today=None, user_id=None, max_passes=None):
+    """Insert every due occurrence of every active rule (or one user's); returns how many.
+
+    Safe to rerun and to run late: a missed day is caught up on the next run,
+    and occurrences already materialized are never inserted again. With
+    max_passes, rules may be left partly caught up for a later run.
+    """
+    today = today or datetime.now().date()
+    created = 0
+    touched = set()
+
+    # Each pass moves every due rule forward by up to RECURRING_MAX_CATCHUP
+    # occurrences; passes repeat until no rule is due any more
+    passes = 0
+    while max_passes is None or passes < max_passes:
+        passes += 1
+        after_id = 0
+        found = False
+        while True:
+            last_id, counts = repository.materialize_recurring_batch(today, after_id, user_id)
+            if last_id is None:
+                break
+
+            found = True
+            after_id = last_id
+            touched.update(counts)
+            created += sum(counts.values())
+
+        if not found:
+            break
+
+    # Once per user, however many passes and batches touched them
+    touched = sorted(touched)
+    for start in range(0, len(touched), repository.FORECAST_BATCH_USERS):
+        refresh_forecasts(touched[start:start + repository.FORECAST_BATCH_USERS])
+    return created
+
+# ------------------ EXPORT ------------------
+
+EXPORT_CHUNK_BYTES = int(os.environ.get("EXPORT_CHUNK_BYTES", 64 * 1024))
+PDF_ROWS_PER_TABLE = int(os.environ.get("PDF_ROWS_PER_TABLE", 100))
+PDF_SPOOL_MAX_BYTES = int(os.environ.get("PDF_SPOOL_MAX_BYTES", 8 * 1024 * 1024))
+
+def parse_export_filters(args):
+    """Read optional from_date/to_date/category query args; raises ValueError on bad dates."""
+    filters = {}
+
+    for name in ("from_date", "to_date"):
+        value = args.get(name)
+        if value:
+            filters[name] = datetime.strptime(value, "%Y-%m-%d").date()
+
+    if args.get("category"):
+        filters["category"] = args["category"]
+
+    return filters
+
+def stream_transactions_csv(user_id, kind, filters):
+    """Yield CSV text in ~EXPORT_CHUNK_BYTES chunks straight from a server-side cursor."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["Title", "Amount", "Category", "Date"])
+
+    # Send the header before the query runs so the download starts immediately
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    for row in repository.iter_export_rows(user_id, kind, filters):
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+def build_expenses_pdf(user_id, filters):
+    """Render the expenses report into a spooled buffer that only spills to disk when large."""
+    from finance import pdf
+
+    output = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_BYTES)
+    rows = repository.iter_export_rows(user_id, "expense", filters)
+    try:
+        pdf.write_expenses_pdf(output, rows, PDF_ROWS_PER_TABLE)
+    finally:
+        rows.close()
+    output.seek(0)
+
+    return output
+
+# ------------------ IMPORT ------------------
+
+def import_transactions(user_id, parsed):
+    counts, errors = repository.import_transactions(user_id, parsed)
+    if counts is not None:
+        refresh_forecasts([user_id])
+    return counts, errors
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from finance import create_app, db, repository
+
+# These tests run against a real PostgreSQL database, which they wipe:
+#   TEST_DATABASE_URL=postgresql://localhost/finance_test python -m pytest
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+
+@pytest.fixture(scope="session")
+def app():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    app = create_app()
+    db.use_database(TEST_DATABASE_URL)
+    with app.app_context():
+        conn = db.get_db_connection()
+        conn.cursor().execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public")
+        conn.commit()
+        db.run_migrations()
+    return app
+
+
+@pytest.fixture
+def user_id(app, request):
+    with app.app_context():
+        username = f"test-{request.node.name}"
+        repository.create_user(username, "pw")
+        yield repository.find_user(username, "pw")["id"]
+
+
+@pytest.fixture
+def cursor(user_id):
+    return db.get_db_connection().cursor()
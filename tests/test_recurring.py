@@ -0,0 +1,47 @@
+from datetime import date
+
+from finance import repository, services
+
+
+def occurrences(cursor, rule_id):
+    cursor.execute("SELECT period, COUNT(*) AS n FROM recurring_occurrences WHERE rule_id = %s GROUP BY 1", (rule_id,))
+    return {row["period"]: row["n"] for row in cursor.fetchall()}
+
+def expense_dates(cursor, user_id):
+    cursor.execute("SELECT date FROM expenses WHERE user_id = %s ORDER BY date", (user_id,))
+    return [row["date"] for row in cursor.fetchall()]
+
+
+def test_rerunning_materializes_each_occurrence_once(user_id, cursor):
+    rule_id = repository.create_recurring_rule(
+        user_id, "expense", "Rent", 500, "Housing", "monthly", 1, date(2026, 1, 31), None
+    )
+
+    created = services.materialize_recurring(today=date(2026, 4, 15), user_id=user_id)
+    again = services.materialize_recurring(today=date(2026, 4, 15), user_id=user_id)
+
+    assert (created, again) == (3, 0)
+    # Month ends clamp to the last day rather than drifting
+    assert expense_dates(cursor, user_id) == [date(2026, 1, 31), date(2026, 2, 28), date(2026, 3, 31)]
+    assert len(occurrences(cursor, rule_id)) == 3
+    assert repository.verify_rollup(user_id) == []
+
+def test_reset_rule_does_not_duplicate(user_id, cursor):
+    repository.create_recurring_rule(user_id, "expense", "Gym", 5, None, "weekly", 1, date(2026, 3, 2), None)
+    assert services.materialize_recurring(today=date(2026, 3, 20), user_id=user_id) == 3
+
+    # Even a rule rewound to its start only claims occurrences the ledger lacks
+    cursor.execute("UPDATE recurring_rules SET next_index = 0, next_date = start_date WHERE user_id = %s", (user_id,))
+    cursor.connection.commit()
+
+    assert services.materialize_recurring(today=date(2026, 3, 20), user_id=user_id) == 0
+    assert len(expense_dates(cursor, user_id)) == 3
+    assert repository.verify_rollup(user_id) == []
+
+def test_single_pass_is_bounded_and_scheduler_catches_up(user_id, cursor, monkeypatch):
+    monkeypatch.setattr(repository, "RECURRING_MAX_CATCHUP", 5)
+    repository.create_recurring_rule(user_id, "expense", "Coffee", 3, "Food", "custom", 1, date(2026, 1, 1), None)
+
+    assert services.materialize_recurring(today=date(2026, 1, 12), user_id=user_id, max_passes=1) == 5
+    assert services.materialize_recurring(today=date(2026, 1, 12), user_id=user_id) == 7
+    assert len(expense_dates(cursor, user_id)) == 12
@@ -0,0 +1,55 @@
+from datetime import date
+
+from finance import repository
+
+
+def last_id(cursor, table, user_id):
+    cursor.execute(f"SELECT MAX(id) AS id FROM {table} WHERE user_id = %s", (user_id,))
+    return cursor.fetchone()["id"]
+
+def rollup(cursor, user_id):
+    cursor.execute(
+        "SELECT kind, month, category, total, count FROM monthly_rollup WHERE user_id = %s ORDER BY 1, 2, 3",
+        (user_id,)
+    )
+    return [tuple(row.values()) for row in cursor.fetchall()]
+
+
+def test_insert_update_delete_keep_rollup_in_step(user_id, cursor):
+    repository.add_transaction(user_id, "expense", "Lunch", 12.5, "Food", date(2026, 3, 4))
+    repository.add_transaction(user_id, "expense", "Dinner", 20, "Food", date(2026, 3, 9))
+    repository.add_transaction(user_id, "income", "Pay", 1000, "Job", date(2026, 3, 1))
+    assert repository.verify_rollup(user_id) == []
+
+    # Moving a row to another month and category moves its amount with it
+    dinner = last_id(cursor, "expenses", user_id)
+    assert repository.update_transaction(user_id, "expense", dinner, "Dinner", 25, "Eating out", date(2026, 4, 2))
+    assert repository.verify_rollup(user_id) == []
+
+    repository.delete_transaction(user_id, "expense", dinner)
+    assert repository.verify_rollup(user_id) == []
+    assert rollup(cursor, user_id) == [
+        ("expense", date(2026, 3, 1), "Food", 12.5, 1),
+        ("income", date(2026, 3, 1), "Job", 1000, 1),
+    ]
+
+def test_import_keeps_rollup_in_step(user_id):
+    rows = [
+        (2, ("expense", "Bus", 2.5, "Transport", date(2026, 1, 3))),
+        (3, ("expense", "Bus", 2.5, "Transport", date(2026, 1, 4))),
+        (4, ("income", "Refund", 10, None, date(2026, 2, 1))),
+    ]
+    counts, errors = repository.import_transactions(user_id, iter(rows))
+
+    assert errors == []
+    assert counts == {"income": 1, "expense": 2}
+    assert repository.verify_rollup(user_id) == []
+
+def test_rebuild_rollup_repairs_drift(user_id, cursor):
+    repository.add_transaction(user_id, "expense", "Lunch", 12.5, "Food", date(2026, 3, 4))
+    cursor.execute("UPDATE monthly_rollup SET total = total + 1 WHERE user_id = %s", (user_id,))
+    cursor.connection.commit()
+    assert len(repository.verify_rollup(user_id)) == 1
+
+    repository.rebuild_rollup(user_id)
+    assert repository.verify_rollup(user_id) == []